@@ -0,0 +1,47 @@
+"""
+Time analysis.determine_forest on meshes made of many small disconnected contours.
+
+Usage::
+
+  python benchmarks/benchmark_determine_forest.py [--elements-per-component N] [--repeat N]
+
+The element ids are walked once in ascending order and each plant starts from the next element
+not yet visited, so the time per component should stay roughly constant as the number of
+components grows.
+"""
+import argparse
+import timeit
+
+from exf2mbfxml.analysis import determine_forest
+
+
+def disconnected_components(components_count, elements_per_component):
+    """
+    Create the analysis elements for the given number of disconnected open contours.
+    """
+    elements = []
+    node_id = 1
+    for _ in range(components_count):
+        for _ in range(elements_per_component):
+            elements.append({'id': len(elements) + 1, 'start_node': node_id, 'end_node': node_id + 1})
+            node_id += 1
+        node_id += 1
+
+    return elements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark determine_forest with many disconnected components.")
+    parser.add_argument("--elements-per-component", type=int, default=4, help="Number of elements in each component.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timing repeats, the best time is reported.")
+    args = parser.parse_args()
+
+    print(f"{'components':>10s} {'elements':>10s} {'time [s]':>10s} {'per component [us]':>20s}")
+    for components_count in [1000, 3000, 10000, 30000, 100000]:
+        elements = disconnected_components(components_count, args.elements_per_component)
+        elapsed = min(timeit.repeat(lambda: determine_forest(elements, {}), number=1, repeat=args.repeat))
+        print(f"{components_count:10d} {len(elements):10d} {elapsed:10.3f} {elapsed / components_count * 1e6:20.2f}")
+
+
+if __name__ == "__main__":
+    main()
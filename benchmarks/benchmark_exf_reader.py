@@ -0,0 +1,102 @@
+"""
+Compare reading EXF files with the native parser against reading them with Zinc.
+
+Usage::
+
+  python benchmarks/benchmark_exf_reader.py [--repeat N] [--sizes N ...] [exf files ...]
+
+With no files given, all the EXF files in tests/resources are used. A synthetic EXF file is also
+written and read for each size in nodes, as made by benchmark_stages.py, give --sizes with no
+values to skip them. For each file the Zinc region.readFile and the native parse_exf stages are
+timed on their own, as well as read_exf end to end with each of the readers.
+"""
+import argparse
+import glob
+import os
+import tempfile
+import timeit
+
+from cmlibs.zinc.context import Context
+
+from benchmark_stages import DEFAULT_SIZES, synthetic_options
+from exf2mbfxml.exceptions import EXFUnsupported
+from exf2mbfxml.exfparser import parse_exf
+from exf2mbfxml.reader import read_exf
+from exf2mbfxml.synthetic import write_synthetic_exf
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+
+def _best_time(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def _read_file(file_name):
+    # The region is only valid while its context exists.
+    context = Context('benchmark')
+    context.getDefaultRegion().readFile(file_name)
+
+
+def _measure(file_name, repeat):
+    """
+    Return the best times of readFile, parse_exf and read_exf with each reader, the native
+    times are None if the file is not supported by the native parser.
+    """
+    read_file_time = _best_time(lambda: _read_file(file_name), repeat)
+    zinc_time = _best_time(lambda: read_exf(file_name), repeat)
+    try:
+        parse_time = _best_time(lambda: parse_exf(file_name), repeat)
+    except EXFUnsupported:
+        return read_file_time, None, zinc_time, None
+
+    native_time = _best_time(lambda: read_exf(file_name, native_parser=True), repeat)
+    return read_file_time, parse_time, zinc_time, native_time
+
+
+def benchmark(file_names, sizes, repeat, log=None):
+    """
+    Measure the readers on each file and on a synthetic file of each size, returning a list
+    of the name and the times of each.
+    """
+    results = []
+
+    def add_result(name, file_name):
+        result = (name,) + _measure(file_name, repeat)
+        results.append(result)
+        if log is not None:
+            log(result)
+
+    for file_name in file_names:
+        add_result(os.path.basename(file_name), file_name)
+
+    with tempfile.TemporaryDirectory() as directory:
+        exf_file = os.path.join(directory, 'synthetic.exf')
+        for size in sizes:
+            counts = write_synthetic_exf(exf_file, **synthetic_options(size))
+            add_result(f"synthetic {counts['nodes']} nodes", exf_file)
+
+    return results
+
+
+def _print_result(result):
+    name, read_file_time, parse_time, zinc_time, native_time = result
+    if parse_time is None:
+        print(f"{name:40s} {read_file_time * 1000:13.2f} {'unsupported, uses zinc':>25s} {zinc_time * 1000:12.2f}")
+    else:
+        print(f"{name:40s} {read_file_time * 1000:13.2f} {parse_time * 1000:12.2f} {zinc_time * 1000:12.2f} {native_time * 1000:12.2f} {zinc_time / native_time:7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the native EXF reader against the Zinc reader.")
+    parser.add_argument("files", nargs="*", help="EXF files to read.")
+    parser.add_argument("--sizes", type=int, nargs="*", default=DEFAULT_SIZES, help="Approximate numbers of nodes of the synthetic files.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timing repeats, the best time is reported.")
+    args = parser.parse_args()
+
+    file_names = args.files if args.files else sorted(glob.glob(os.path.join(here, "..", "tests", "resources", "*.exf")))
+    print(f"{'file':40s} {'readFile [ms]':>13s} {'parse [ms]':>12s} {'zinc [ms]':>12s} {'native [ms]':>12s} {'speedup':>8s}")
+    benchmark(file_names, args.sizes, args.repeat, _print_result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Compare writing point elements one at a time with formatting runs of points at once.
+
+Usage::
+
+  python benchmarks/benchmark_point_formatting.py [--precision N] [--repeat N]
+
+The per point path creates an element for each point and serializes it, the batched path
+formats the whole run of points into point element text directly.
+"""
+import argparse
+import timeit
+
+import numpy as np
+import xml.etree.ElementTree as ET
+
+from exf2mbfxml.writer import _format_points, _write_points
+
+
+def per_point(points, precision):
+    parent_element = ET.Element("tree")
+    _write_points(parent_element, points, precision)
+    ET.indent(parent_element, level=1)
+    return ET.tostring(parent_element, encoding="unicode")
+
+
+def batched(points, precision):
+    return _format_points(points, precision, "\n    ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per point and batched point formatting.")
+    parser.add_argument("--precision", type=int, default=2, help="Number of decimal places of the formatted values.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timing repeats, the best time is reported.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(19)
+    print(f"{'points':>10s} {'per point [s]':>14s} {'batched [s]':>12s} {'speed up':>9s}")
+    for point_count in [1000, 10000, 100000, 1000000]:
+        points = (rng.random((point_count, 4)) * 1000.0).tolist()
+        per_point_time = min(timeit.repeat(lambda: per_point(points, args.precision), number=1, repeat=args.repeat))
+        batched_time = min(timeit.repeat(lambda: batched(points, args.precision), number=1, repeat=args.repeat))
+        print(f"{point_count:10d} {per_point_time:14.3f} {batched_time:12.3f} {per_point_time / batched_time:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Time and memory profile each stage of the conversion on synthetic EXF files.
+
+Usage::
+
+  python benchmarks/benchmark_stages.py run [--sizes N ...] [--repeat N] [--output results.json]
+  python benchmarks/benchmark_stages.py compare baseline.json results.json [--threshold F] [--memory-threshold F] [--min-time S]
+
+The run command writes a synthetic EXF file for each size in nodes, then measures the stages
+region.readFile, extract_mesh_info, determine_forest, classify_forest, read_markers and
+write_mbfxml. The extract_mesh_info stage includes the determine_forest, classify_forest and
+read_markers stages, which are measured again on their own with the arguments captured from
+a separate, unmeasured run of extract_mesh_info. The best time of the repeats and the peak traced Python memory of a separate
+run are stored as JSON. Memory allocated by Zinc itself is not traced.
+
+The compare command matches the results by size and flags every stage that is slower, or uses
+more memory, than the baseline by more than the threshold fraction, returning 1 if any were flagged.
+Increases of less than the minimum time, or of less than 64 KiB of memory, are ignored as noise.
+"""
+import argparse
+import contextlib
+import copy
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from cmlibs.zinc.context import Context
+
+import exf2mbfxml
+import exf2mbfxml.reader
+from exf2mbfxml.analysis import classify_forest, determine_forest, read_markers
+from exf2mbfxml.reader import extract_mesh_info
+from exf2mbfxml.synthetic import write_synthetic_exf
+from exf2mbfxml.utilities import determine_fields
+from exf2mbfxml.writer import write_mbfxml
+
+STAGES = ['readFile', 'extract_mesh_info', 'determine_forest', 'classify_forest', 'read_markers', 'write_mbfxml']
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+MINIMUM_MEMORY_INCREASE = 65536
+
+
+def synthetic_options(node_count):
+    """
+    Return the synthetic EXF file options for a morphology of about node_count nodes.
+    """
+    return {
+        'node_count': node_count, 'tree_count': max(1, node_count // 20000), 'branching_factor': 2, 'tree_depth': 6,
+        'contour_count': max(1, node_count // 2000), 'vessel_count': max(1, node_count // 10000), 'three_node_branches': True,
+        'group_count': 10, 'marker_count': max(1, node_count // 1000),
+    }
+
+
+@contextlib.contextmanager
+def _capture_arguments(module, name, captured):
+    """
+    Record a deep copy of the arguments of every call of the function of the module while in the context.
+    """
+    function = getattr(module, name)
+
+    def recorder(*args):
+        captured[name] = copy.deepcopy(args)
+        return function(*args)
+
+    setattr(module, name, recorder)
+    try:
+        yield
+    finally:
+        setattr(module, name, function)
+
+
+def _measure(stages, stage, function, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    if trace_memory:
+        stages[stage] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        stages[stage] = elapsed
+
+    return result
+
+
+def _capture_stage_arguments(exf_file):
+    """
+    Run extract_mesh_info without measuring it, returning the arguments passed to the
+    determine_forest and iterate_forest stages.
+    """
+    captured = {}
+    context = Context('capture')
+    region = context.getDefaultRegion()
+    region.readFile(exf_file)
+    with _capture_arguments(exf2mbfxml.reader, 'determine_forest', captured), _capture_arguments(exf2mbfxml.reader, 'iterate_forest', captured):
+        extract_mesh_info(region)
+
+    return captured
+
+
+def _run_stages(exf_file, mbf_file, captured, trace_memory):
+    """
+    Run the conversion stages once, returning the time or the peak traced memory of each stage.
+    """
+    stages = {}
+    # The region is only valid while its context exists.
+    context = Context('benchmark')
+    region = context.getDefaultRegion()
+    _measure(stages, 'readFile', lambda: region.readFile(exf_file), trace_memory)
+    mesh_info = _measure(stages, 'extract_mesh_info', lambda: extract_mesh_info(region), trace_memory)
+
+    # The stages change some of their arguments, so each run uses its own copy.
+    determine_arguments = copy.deepcopy(captured['determine_forest'])
+    _measure(stages, 'determine_forest', lambda: determine_forest(*determine_arguments), trace_memory)
+    classify_arguments = copy.deepcopy(captured['iterate_forest'])
+    _measure(stages, 'classify_forest', lambda: classify_forest(*classify_arguments), trace_memory)
+
+    _, available_fields, _ = determine_fields(region.getFieldmodule())
+    data_fields = {available_field.getName(): available_field for available_field in available_fields}
+    _measure(stages, 'read_markers', lambda: read_markers(region, data_fields), trace_memory)
+    _measure(stages, 'write_mbfxml', lambda: write_mbfxml(mbf_file, mesh_info), trace_memory)
+    return stages
+
+
+def benchmark(sizes, repeat, log=None):
+    """
+    Measure the stages for a synthetic file of each size, returning a list of results.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        exf_file = os.path.join(directory, 'synthetic.exf')
+        mbf_file = os.path.join(directory, 'synthetic.xml')
+        for size in sizes:
+            counts = write_synthetic_exf(exf_file, **synthetic_options(size))
+            captured = _capture_stage_arguments(exf_file)
+            runs = [_run_stages(exf_file, mbf_file, captured, False) for _ in range(repeat)]
+            memory = _run_stages(exf_file, mbf_file, captured, True)
+            result = {
+                'size': size, 'counts': counts,
+                'stages': {stage: {'time': min(run[stage] for run in runs), 'peak_memory': memory[stage]} for stage in STAGES},
+            }
+            results.append(result)
+            if log is not None:
+                log(result)
+
+    return results
+
+
+def compare(baseline, current, threshold, memory_threshold, min_time=0.01):
+    """
+    Return a list of (size, stage, measure, baseline value, current value) for each
+    measurement of the current results exceeding the baseline by more than the threshold.
+    """
+    thresholds = {'time': (threshold, min_time), 'peak_memory': (memory_threshold, MINIMUM_MEMORY_INCREASE)}
+    baseline_results = {result['size']: result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        baseline_result = baseline_results.get(result['size'])
+        if baseline_result is None:
+            continue
+
+        for stage in STAGES:
+            for measure, (limit, minimum_increase) in thresholds.items():
+                baseline_value = baseline_result['stages'][stage][measure]
+                value = result['stages'][stage][measure]
+                if value > baseline_value * (1.0 + limit) and value - baseline_value > minimum_increase:
+                    regressions.append((result['size'], stage, measure, baseline_value, value))
+
+    return regressions
+
+
+def _print_result(result):
+    for stage in STAGES:
+        measurement = result['stages'][stage]
+        print(f"{result['size']:10d} {stage:20s} {measurement['time']:10.3f} {measurement['peak_memory'] / 2 ** 20:12.1f}")
+
+
+def _run(args):
+    print(f"{'nodes':>10s} {'stage':20s} {'time [s]':>10s} {'peak [MiB]':>12s}")
+    results = benchmark(args.sizes, args.repeat, _print_result)
+    report = {
+        'metadata': {
+            'version': exf2mbfxml.__version__, 'python': platform.python_version(), 'platform': platform.platform(),
+            'processor': platform.processor(), 'date': datetime.datetime.now().isoformat(timespec='seconds'), 'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+
+def _compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = compare(baseline, current, args.threshold, args.memory_threshold, args.min_time)
+    for size, stage, measure, baseline_value, value in regressions:
+        print(f"Regression: {stage} {measure} for {size} nodes, {baseline_value:.6g} -> {value:.6g} ({value / baseline_value:.2f}x)")
+    if not regressions:
+        print("No regressions found.")
+
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the conversion on synthetic EXF files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Measure the stages and optionally store the results as JSON.")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Approximate numbers of nodes of the synthetic files.")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Number of timing repeats, the best time is reported.")
+    run_parser.add_argument("--output", help="Location of the JSON results file.")
+    compare_parser = subparsers.add_parser("compare", help="Flag regressions of results against a baseline.")
+    compare_parser.add_argument("baseline", help="JSON results file of the baseline.")
+    compare_parser.add_argument("current", help="JSON results file to check.")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Allowed fractional increase in time [defaults to 0.1].")
+    compare_parser.add_argument("--memory-threshold", type=float, default=0.1, help="Allowed fractional increase in peak memory [defaults to 0.1].")
+    compare_parser.add_argument("--min-time", type=float, default=0.01, help="Smallest increase in time in seconds flagged [defaults to 0.01].")
+    args = parser.parse_args()
+
+    return _run(args) if args.command == "run" else _compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""
+Time analysis._traverse_forward_path on long unbranched chains of elements.
+
+Usage::
+
+  python benchmarks/benchmark_traverse_forward_path.py [--sizes N ...] [--repeat N]
+
+The traversal is iterative and checks for loops against the set of visited elements, so the
+time per node should stay about the same as the chains get longer.
+"""
+import argparse
+import timeit
+
+from exf2mbfxml.adjacency import AdjacencyIndex
+from exf2mbfxml.analysis import _traverse_forward_path
+
+
+def chain(node_count):
+    """
+    Create the adjacency index of a single chain of elements joining the given number of nodes.
+    """
+    return AdjacencyIndex([{'id': node, 'start_node': node, 'end_node': node + 1} for node in range(1, node_count)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the forward path traversal on long chains.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="Numbers of nodes in the chains.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timing repeats, the best time is reported.")
+    args = parser.parse_args()
+
+    print(f"{'nodes':>10s} {'time [s]':>10s} {'per node [us]':>14s}")
+    for node_count in args.sizes:
+        adjacency = chain(node_count)
+        elapsed = min(timeit.repeat(lambda: _traverse_forward_path(adjacency, 1, set()), number=1, repeat=args.repeat))
+        print(f"{node_count:10d} {elapsed:10.3f} {elapsed / node_count * 1e6:14.3f}")
+
+
+if __name__ == "__main__":
+    main()
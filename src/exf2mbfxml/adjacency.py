@@ -0,0 +1,122 @@
+"""
+Adjacency index of the nodes and elements of a 1D mesh for the analysis traversals.
+"""
+import numpy as np
+
+
+class AdjacencyIndex(object):
+    """
+    Forward and backward adjacency of the nodes and elements of a list of analysis elements.
+
+    The elements are read in a single pass into integer arrays, which are then sorted by start
+    node and by end node into compressed sparse row tables. For each node the forward table
+    holds the elements starting at the node, the backward table the elements ending at the
+    node, both in the order of the input elements.
+    """
+    __slots__ = ('_node_index', '_element_index', '_element_starts', '_element_ends',
+                 '_forward_offsets', '_forward_nodes', '_forward_elements',
+                 '_backward_offsets', '_backward_nodes', '_backward_elements', '_end_nodes')
+
+    def __init__(self, elements):
+        values = []
+        for element in elements:
+            values.extend((element['id'], element['start_node'], element['end_node']))
+
+        element_count = len(values) // 3
+        element_table = np.array(values, dtype=np.int64).reshape(element_count, 3)
+        element_ids = element_table[:, 0]
+        start_nodes = element_table[:, 1]
+        end_nodes = element_table[:, 2]
+
+        nodes, node_positions = np.unique(element_table[:, 1:].T, return_inverse=True)
+        node_positions = node_positions.reshape(2, element_count)
+        node_count = len(nodes)
+
+        self._node_index = dict(zip(nodes.tolist(), range(node_count)))
+        self._element_index = dict(zip(element_ids.tolist(), range(element_count)))
+        self._element_starts = start_nodes.tolist()
+        self._element_ends = end_nodes.tolist()
+
+        self._forward_offsets, forward_order = _build_offsets(node_positions[0], node_count)
+        self._forward_nodes = end_nodes[forward_order].tolist()
+        self._forward_elements = element_ids[forward_order].tolist()
+
+        self._backward_offsets, backward_order = _build_offsets(node_positions[1], node_count)
+        self._backward_nodes = start_nodes[backward_order].tolist()
+        self._backward_elements = element_ids[backward_order].tolist()
+        self._end_nodes = None
+
+    def element_ids(self):
+        return self._element_index.keys()
+
+    def has_element(self, element_id):
+        return element_id in self._element_index
+
+    def element_start(self, element_id):
+        return self._element_starts[self._element_index[element_id]]
+
+    def element_end(self, element_id):
+        return self._element_ends[self._element_index[element_id]]
+
+    def forward_count(self, node_id):
+        index = self._node_index.get(node_id)
+        return 0 if index is None else self._forward_offsets[index + 1] - self._forward_offsets[index]
+
+    def backward_count(self, node_id):
+        index = self._node_index.get(node_id)
+        return 0 if index is None else self._backward_offsets[index + 1] - self._backward_offsets[index]
+
+    def forward_nodes(self, node_id):
+        """
+        Return the end nodes of the elements starting at the node.
+        """
+        return _lookup(self._node_index, self._forward_offsets, self._forward_nodes, node_id)
+
+    def backward_nodes(self, node_id):
+        """
+        Return the start nodes of the elements ending at the node.
+        """
+        return _lookup(self._node_index, self._backward_offsets, self._backward_nodes, node_id)
+
+    def node_elements(self, node_id):
+        """
+        Return the elements starting or ending at the node.
+        """
+        return (_lookup(self._node_index, self._forward_offsets, self._forward_elements, node_id) +
+                _lookup(self._node_index, self._backward_offsets, self._backward_elements, node_id))
+
+    def forward_elements(self, element_id):
+        """
+        Return the elements starting at the end node of the element.
+        """
+        return _lookup(self._node_index, self._forward_offsets, self._forward_elements, self.element_end(element_id))
+
+    def backward_elements(self, element_id):
+        """
+        Return the elements ending at the start node of the element.
+        """
+        return _lookup(self._node_index, self._backward_offsets, self._backward_elements, self.element_start(element_id))
+
+    def end_nodes(self):
+        """
+        Return the set of nodes with at least one element ending at them.
+        """
+        if self._end_nodes is None:
+            self._end_nodes = {node_id for node_id, index in self._node_index.items() if self._backward_offsets[index + 1] > self._backward_offsets[index]}
+
+        return self._end_nodes
+
+
+def _build_offsets(positions, count):
+    order = np.argsort(positions, kind='stable')
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(positions, minlength=count), out=offsets[1:])
+    return offsets.tolist(), order
+
+
+def _lookup(index, offsets, values, key):
+    position = index.get(key)
+    if position is None:
+        return []
+
+    return values[offsets[position]:offsets[position + 1]]
@@ -1,107 +1,104 @@
+import numpy as np
+
 from cmlibs.zinc.context import Context
 
-from exf2mbfxml.utilities import nest_sequence, get_unique_list_paths, get_identifiers_from_path, determine_fields
-from exf2mbfxml.zinc import get_point, get_colour, get_resolution, get_markers, get_string
+from exf2mbfxml.adjacency import AdjacencyIndex
+from exf2mbfxml.profiling import stage_iterator
+from exf2mbfxml.utilities import nest_sequences, get_unique_list_paths, get_identifiers_from_path, determine_fields, rgb_to_hex
+from exf2mbfxml.zinc import get_markers, get_string, get_node_table
 
 from typing import Union, List
 from collections import defaultdict
 
 Branch = Union[int, List["Branch"]]
 
+_END = object()
 
-def _build_node_graph(elements):
-    graph = defaultdict(lambda: {"start": [], "end": []})
-
-    for element in elements:
-        node1 = element["start_node"]
-        node2 = element["end_node"]
-        graph[node1]["start"].append(element["id"])
-        graph[node2]["end"].append(element["id"])
-
-    return graph
-
-
-def _find_neighbours(element, node_graph, buckets):
-    node_id = element[buckets[0]]
-    return node_graph[node_id][buckets[1]]
 
-
-def _build_element_graph(elements, node_graph):
-    element_graph = {}
-
-    for element in elements:
-        forward_neighbours = _find_neighbours(element, node_graph, ["end_node", "start"])
-        backward_neighbours = _find_neighbours(element, node_graph, ["start_node", "end"])
-        element_graph[element["id"]] = {
-            "forward": forward_neighbours,
-            "backward": backward_neighbours
-        }
-
-    return element_graph
+def _build_group_element_graph(adjacency, element_ids):
+    """
+    Build the backward adjacency of the element graph restricted to the given group elements,
+    visiting only the group elements.
+    """
+    return {e: list(set(adjacency.backward_elements(e)).intersection(element_ids)) for e in element_ids if adjacency.has_element(e)}
 
 
-def _traverse_backwards(element_id, element_graph):
+def _traverse_backwards(element_id, backward_elements):
+    """
+    Traverse backwards from the element following the first backward neighbour given by
+    backward_elements, returning the path of elements.
+    """
     path = [element_id]
+    path_set = {element_id}
     current_element_id = element_id
 
     while True:
-        backward_neighbours = element_graph[current_element_id]["backward"]
+        backward_neighbours = backward_elements(current_element_id)
         if not backward_neighbours:
             break
         current_element_id = backward_neighbours[0]  # Assuming one backward neighbour
-        if current_element_id in path:
+        if current_element_id in path_set:
             break
 
         path.append(current_element_id)
+        path_set.add(current_element_id)
 
     return path
 
 
-def _traverse_forward_path(node_map, start_node, node_to_element_map, visited):
-    def traverse(node, is_branch=False, path=None):
-        if path is None:
-            path = []
-
-        # Detect loop
-        if node in path:
-            return node
-
-        path.append(node)
-        visited.update(node_to_element_map.get(node, set()))
-
-        # If no further connections, return node or list depending on context
-        if node not in node_map:
-            return [node] if is_branch else node
-
-        next_nodes = node_map[node]
-
-        # If only one path forward, continue linearly
-        if len(next_nodes) == 1:
-            result = traverse(next_nodes[0], path=path)
-            return [node, *result] if isinstance(result, list) else [node, result]
-
-        # If multiple paths, treat as a branch
-        branch_list = [node]
-        for next_node in sorted(next_nodes):
-            branch_list.append(traverse(next_node, is_branch=True, path=path))
-        return branch_list
-
-    return traverse(start_node)
-
+def _traverse_forward_path(adjacency, start_node, visited):
+    """
+    Traverse forward from the start node, returning the nested path of nodes.
+    A linear run of nodes is a flat list, a node with multiple next nodes is followed by
+    one nested list per branch. Nodes already seen are not traversed again.
+    """
+    seen = set()
+
+    def follow(node, is_branch):
+        """
+        Follow the linear run of nodes from node, returning the run and the
+        sorted next nodes if the run ends at a branch node.
+        """
+        run = []
+        while True:
+            # Detect loop
+            if node in seen:
+                run.append(node)
+                return (run if len(run) > 1 else node), None
+
+            seen.add(node)
+            visited.update(adjacency.node_elements(node))
+
+            # If no further connections, return node or list depending on context
+            next_nodes = adjacency.forward_nodes(node)
+            if not next_nodes:
+                run.append(node)
+                return (run if len(run) > 1 or is_branch else node), None
+
+            run.append(node)
+
+            # If only one path forward, continue linearly
+            if len(next_nodes) != 1:
+                return run, sorted(next_nodes)
+
+            node = next_nodes[0]
+
+    path, next_nodes = follow(start_node, False)
+    stack = [] if next_nodes is None else [(path, iter(next_nodes))]
+    while stack:
+        branch_list, remaining_nodes = stack[-1]
+        next_node = next(remaining_nodes, _END)
+        if next_node is _END:
+            stack.pop()
+            continue
 
-def _build_maps(elements):
-    node_map = defaultdict(list)
-    reverse_node_map = defaultdict(list)
-    element_map = defaultdict(set)
-    for element in elements:
-        start = element['start_node']
-        end = element['end_node']
-        element_map[start].add(element['id'])
-        element_map[end].add(element['id'])
-        node_map[start].append(end)
-        reverse_node_map[end].append(start)
+        # If multiple paths, treat each as a branch
+        branch, next_nodes = follow(next_node, True)
+        branch_list.append(branch)
+        if next_nodes is not None:
+            stack.append((branch, iter(next_nodes)))
 
-    return node_map, reverse_node_map, element_map
+    return path
 
 
 def _flatten_to_set(nested_list):
@@ -118,11 +115,11 @@ def _flatten_to_set(nested_list):
     return flat_set
 
 
-def _find_edges(forward_map, reverse_map):
+def _find_edges(forward_map, adjacency):
     edges = []
 
     def is_junction(node):
-        return len(forward_map.get(node, [])) > 1 or len(reverse_map.get(node, [])) > 1
+        return len(forward_map.get(node, [])) > 1 or adjacency.backward_count(node) > 1
 
     def traverse_edge(start_node, seeded_next_node):
         edge = [start_node]
@@ -137,7 +134,7 @@ def _find_edges(forward_map, reverse_map):
         edges.append(edge)
 
     # Find start points (nodes with no incoming edges or junctions).
-    start_points = set(forward_map.keys()) - set(reverse_map.keys())
+    start_points = set(forward_map.keys()) - adjacency.end_nodes()
     junctions = {node for node in forward_map if is_junction(node)}
 
     for start_point in start_points.union(junctions):
@@ -148,15 +145,9 @@ def _find_edges(forward_map, reverse_map):
 
 
 def determine_forest(elements, grouped_identifiers):
-    node_graph = _build_node_graph(elements)
-    element_graph = _build_element_graph(elements, node_graph)
-    node_map, reverse_node_map, node_to_element_map = _build_maps(elements)
-
-    all_el_ids = set(element_graph.keys())
+    adjacency = AdjacencyIndex(elements)
     visited = set()
 
-    element_lookup = {el['id']: el for el in elements}
-
     group_start_nodes = set()
     for group in grouped_identifiers.values():
 
@@ -167,48 +158,42 @@ def determine_forest(elements, grouped_identifiers):
         except KeyError:
             continue
 
-        sub_element_graph = {e: {'backward': list(set(v['backward']).intersection(element_ids))} for e, v in element_graph.items() if e in element_ids}
-        backward_path = _traverse_backwards(element_id, sub_element_graph)
-        start_node = _find_node_at(backward_path, element_lookup, 'start')
-        end_node = _find_node_at(backward_path, element_lookup, 'end')
+        sub_element_graph = _build_group_element_graph(adjacency, element_ids)
+        backward_path = _traverse_backwards(element_id, sub_element_graph.__getitem__)
+        start_node = adjacency.element_start(backward_path[-1])
+        end_node = adjacency.element_end(backward_path[-1])
         group_start_nodes.add((start_node, end_node))
 
     forest = []
-    remainder = all_el_ids.difference(visited)
-    while remainder:
-        # Select a random element.
-        random_element_id = remainder.pop()
+    # Start each plant from the lowest element id not yet visited.
+    for element_id in sorted(adjacency.element_ids()):
+        if element_id in visited:
+            continue
 
         # Traverse backwards.
-        backward_path = _traverse_backwards(random_element_id, element_graph)
+        backward_path = _traverse_backwards(element_id, adjacency.backward_elements)
 
         # Perform depth-first traversal from the starting element.
-        start_node = _find_node_at(backward_path, element_lookup, 'start')
+        start_node = adjacency.element_start(backward_path[-1])
 
-        forward_path = _traverse_forward_path(node_map, start_node, node_to_element_map, visited)
+        forward_path = _traverse_forward_path(adjacency, start_node, visited)
         path_nodes = _flatten_to_set(forward_path)
-        if _is_vessel_path(path_nodes, reverse_node_map):
+        if _is_vessel_path(path_nodes, adjacency):
             filtered_node_map = {}
             for node_id in path_nodes:
-                if node_id in node_map:
-                    filtered_node_map[node_id] = node_map[node_id]
-            forward_path = _find_edges(filtered_node_map, reverse_node_map)
+                next_nodes = adjacency.forward_nodes(node_id)
+                if next_nodes:
+                    filtered_node_map[node_id] = next_nodes
+            forward_path = _find_edges(filtered_node_map, adjacency)
 
         forest.append(forward_path)
-        remainder = all_el_ids.difference(visited)
 
     return forest, group_start_nodes
 
 
-def _find_node_at(backward_path, element_lookup, location):
-    starting_element_id = backward_path[-1]
-    starting_element = element_lookup[starting_element_id]
-    return starting_element[f'{location}_node']
-
-
-def _is_vessel_path(path_nodes, reverse_node_map):
+def _is_vessel_path(path_nodes, adjacency):
     for node_id in path_nodes:
-        if len(reverse_node_map.get(node_id, [])) > 1:
+        if adjacency.backward_count(node_id) > 1:
             return True
 
     return False
@@ -218,24 +203,28 @@ def _is_list_of_integers(lst):
     return all(isinstance(item, int) for item in lst)
 
 
-def _has_subgroup_of(groups, outer_set):
-    return any(val < outer_set for val in groups.values() if val)
+def _get_point(node_table, index):
+    return node_table['points'][index].tolist()
 
 
-def _get_node(nodes, node_id_map, node_id):
-    return nodes[node_id_map[node_id]]
+def _get_colour(node_table, index):
+    return rgb_to_hex(node_table['colours'][index])
 
 
-def _convert_plant_to_points(plant, nodes, node_id_map, fields):
+def _get_resolution(node_table, index):
+    resolution = node_table['resolutions'][index]
+    return None if np.isnan(resolution) else float(resolution)
+
+
+def _convert_plant_to_points(plant, node_table, node_id_map):
     points = [None] * len(plant)
     point_identifiers = set()
     for index, seg in enumerate(plant):
         if isinstance(seg, list):
-            end_points, end_point_identifiers = _convert_plant_to_points(seg, nodes, node_id_map, fields)
+            end_points, end_point_identifiers = _convert_plant_to_points(seg, node_table, node_id_map)
             point_identifiers.update(end_point_identifiers)
         else:
-            end_node = _get_node(nodes, node_id_map, seg)
-            end_points = get_point(end_node, fields)
+            end_points = _get_point(node_table, node_id_map[seg])
             point_identifiers.add(seg)
 
         points[index] = end_points
@@ -243,40 +232,105 @@ def _convert_plant_to_points(plant, nodes, node_id_map, fields):
     return points, point_identifiers
 
 
-def _condition_equal(set_a, set_b):
-    return set_a == set_b
+def _build_group_index(grouped_nodes):
+    """
+    Index the grouped nodes for matching sets of nodes against the groups.
+    The index keeps the labels of the groups for each distinct node set and, for each node,
+    the labels of the groups containing that node.
+    """
+    group_index = {'groups': grouped_nodes, 'order': {}, 'by_nodes': defaultdict(list), 'postings': defaultdict(set)}
+    for position, (label, node_set) in enumerate(grouped_nodes.items()):
+        group_index['order'][label] = position
+        _add_to_group_index(group_index, label, node_set)
+
+    return group_index
+
+
+def _add_to_group_index(group_index, label, node_set):
+    group_index['by_nodes'][frozenset(node_set)].append(label)
+    postings = group_index['postings']
+    for node in node_set:
+        postings[node].add(label)
+
+
+def _remove_from_group_index(group_index, label, node_set):
+    by_nodes = group_index['by_nodes']
+    key = frozenset(node_set)
+    by_nodes[key].remove(label)
+    if not by_nodes[key]:
+        del by_nodes[key]
 
+    postings = group_index['postings']
+    for node in node_set:
+        postings[node].discard(label)
 
-def _condition_lt(set_a, set_b):
-    return set_a < set_b
 
+def _discard_group_node(group_index, label, node):
+    node_set = group_index['groups'][label]
+    _remove_from_group_index(group_index, label, node_set)
+    node_set.discard(node)
+    _add_to_group_index(group_index, label, node_set)
 
-def _match_group(target_set, labelled_sets, destructively=True, condition_fcn=None):
+
+def _match_group(target_set, group_index):
     """
-    Find and remove the matching labels.
-    Matched labels are removed from the labelled sets input dictionary.
+    Find and remove the labels of the groups equal to the target set.
+    Matched labels are removed from the grouped nodes and the group index.
     """
-    if condition_fcn is None:
-        condition_fcn = _condition_equal
-    matched_labels = []
-    for label, id_set in list(labelled_sets.items()):
-        if condition_fcn(target_set, id_set):
-            matched_labels.append(label)
-            if destructively:
-                labelled_sets.pop(label)
+    labels = group_index['by_nodes'].get(frozenset(target_set))
+    if not labels:
+        return []
+
+    matched_labels = sorted(labels, key=group_index['order'].get)
+    groups = group_index['groups']
+    for label in matched_labels:
+        _remove_from_group_index(group_index, label, groups.pop(label))
 
     return matched_labels
 
 
-def _update_grouped_nodes(grouped_nodes, group_start_nodes, plant_set):
+def _match_supergroups(target_set, group_index):
+    """
+    Find the labels of the groups that the target set is a strict subset of.
+    """
+    groups = group_index['groups']
+    if target_set:
+        postings = group_index['postings']
+        candidates = min((postings.get(node, ()) for node in target_set), key=len)
+        matched_labels = [label for label in candidates if target_set < groups[label]]
+    else:
+        matched_labels = [label for label, node_set in groups.items() if node_set]
+
+    return sorted(matched_labels, key=group_index['order'].get)
+
+
+def _has_subgroup(group_index, outer_set):
+    """
+    Determine if any non-empty group is a strict subset of the outer set.
+    """
+    groups = group_index['groups']
+    postings = group_index['postings']
+    counts = defaultdict(int)
+    for node in outer_set:
+        for label in postings.get(node, ()):
+            counts[label] += 1
+
+    return any(count == len(groups[label]) < len(outer_set) for label, count in counts.items())
+
+
+def _update_grouped_nodes(group_index, group_start_nodes, plant_set):
     used_tuples = set()
 
     modified = False
+    groups = group_index['groups']
+    postings = group_index['postings']
     for start_node in group_start_nodes:
         first, second = start_node
-        for key, node_set in grouped_nodes.items():
-            if first in node_set and second in node_set and node_set < plant_set:
-                node_set.discard(first)
+        # Only the groups holding both nodes can match, taken in group order.
+        candidates = postings.get(first, set()) & postings.get(second, set())
+        for key in sorted(candidates, key=group_index['order'].get):
+            if groups[key] < plant_set:
+                _discard_group_node(group_index, key, first)
                 used_tuples.add(start_node)
                 modified = True
 
@@ -286,14 +340,36 @@ def _update_grouped_nodes(grouped_nodes, group_start_nodes, plant_set):
     return modified
 
 
-def classify_forest(forest, nodes, node_id_map, fields, grouped_nodes, group_start_nodes):
+def classify_forest(forest, node_table, node_id_map, grouped_nodes, group_start_nodes):
+    """
+    Classify the plants of the forest into contours, trees and vessels, and label them with the matching groups.
+    See iterate_forest.
+    """
     classification = {'contours': [], 'trees': [], 'vessels': []}
+    for category, item in iterate_forest(forest, node_table, node_id_map, grouped_nodes, group_start_nodes):
+        classification[category].append(item)
+
+    return classification
+
+
+def iterate_forest(forest, node_table, node_id_map, grouped_nodes, group_start_nodes):
+    """
+    Classify the plants of the forest one at a time, yielding the category and the classified
+    plant, one of 'contours', 'trees' or 'vessels', for each plant in forest order.
+
+    The plants are classified in order as the groups matched by a plant are not available to later plants.
+    """
+    return stage_iterator('classify_forest', _iterate_forest(forest, node_table, node_id_map, grouped_nodes, group_start_nodes))
+
+
+def _iterate_forest(forest, node_table, node_id_map, grouped_nodes, group_start_nodes):
     group_implied_structure = _update_node_groups(grouped_nodes)
+    group_index = _build_group_index(grouped_nodes)
 
     for index, plant in enumerate(forest):
         is_vessel = isinstance(plant, tuple)
         list_of_ints = _is_list_of_integers(plant)
-        is_contour = True if not is_vessel and list_of_ints and not _has_subgroup_of(grouped_nodes, set(plant)) else False
+        is_contour = True if not is_vessel and list_of_ints and not _has_subgroup(group_index, set(plant)) else False
         is_tree = not is_vessel and not is_contour
 
         remove_start_nodes = None
@@ -308,47 +384,44 @@ def classify_forest(forest, nodes, node_id_map, fields, grouped_nodes, group_sta
         if is_tree:
             if group_start_nodes:
                 plant_set = _flatten_to_set(plant)
-                modification_made = _update_grouped_nodes(grouped_nodes, group_start_nodes, plant_set)
+                modification_made = _update_grouped_nodes(group_index, group_start_nodes, plant_set)
                 if modification_made:
                     group_implied_structure = _update_node_groups(grouped_nodes)
 
-            for sequence in group_implied_structure:
-                plant = nest_sequence(plant, sequence)
+            plant = nest_sequences(plant, group_implied_structure)
 
         closed_contour = is_contour and plant[0] == plant[-1]
         if closed_contour:
             plant.pop()
 
-        points, point_identifiers = _convert_plant_to_points(plant, nodes, node_id_map, fields)
+        points, point_identifiers = _convert_plant_to_points(plant, node_table, node_id_map)
 
         start_node_id = plant[0][0] if is_vessel else plant[0]
-        start_node = _get_node(nodes, node_id_map, start_node_id)
-        matching_global_labels = _match_group(point_identifiers, grouped_nodes)
-        matching_global_labels.extend(_match_group(point_identifiers, grouped_nodes, destructively=False, condition_fcn=_condition_lt))
+        start_node_index = node_id_map[start_node_id]
+        matching_global_labels = _match_group(point_identifiers, group_index)
+        matching_global_labels.extend(_match_supergroups(point_identifiers, group_index))
 
-        colour = get_colour(start_node, fields)
+        colour = _get_colour(node_table, start_node_index)
         metadata = {'global': {'labels': matching_global_labels, 'colour': colour}}
         if closed_contour:
             metadata['global']['closed'] = True
-        resolution = get_resolution(start_node, fields)
+        resolution = _get_resolution(node_table, start_node_index)
         if resolution is not None:
             metadata['global']['resolution'] = resolution
 
         if is_tree:
-            unique_paths = get_unique_list_paths(plant)
             indexed_metadata = {}
+            unique_paths = get_unique_list_paths(plant)
             for u in unique_paths:
                 path_identifiers = set(get_identifiers_from_path(u, plant))
-                matched_groups = _match_group(path_identifiers, grouped_nodes)
-                matched_groups.extend(_match_group(path_identifiers, grouped_nodes, destructively=False, condition_fcn=_condition_lt))
+                matched_groups = _match_group(path_identifiers, group_index)
+                matched_groups.extend(_match_supergroups(path_identifiers, group_index))
                 matched_groups = set(matched_groups).difference(set(matching_global_labels))
                 indexed_metadata[u] = list(matched_groups)
             metadata['indexed'] = indexed_metadata
 
         category = 'contours' if is_contour else 'trees' if is_tree else 'vessels'
-        classification[category].append({"points": points, "metadata": metadata})
-
-    return classification
+        yield category, {"points": points, "metadata": metadata}
 
 
 def _update_node_groups(grouped_nodes):
@@ -359,7 +432,8 @@ def _update_node_groups(grouped_nodes):
 
 def read_markers(region, fields):
     datapoints = get_markers(region)
-    return [{"point": get_point(datapoint, fields), "metadata": {"name": get_string(datapoint, "marker_name"), "colour": get_colour(datapoint, fields)}} for datapoint in datapoints]
+    node_table = get_node_table(datapoints, fields)
+    return [{"point": _get_point(node_table, index), "metadata": {"name": get_string(datapoint, "marker_name"), "colour": _get_colour(node_table, index)}} for index, datapoint in enumerate(datapoints)]
 
 
 def is_suitable_mesh(input_argument):
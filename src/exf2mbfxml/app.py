@@ -1,39 +1,91 @@
-import os
 import sys
 import argparse
 
-from exf2mbfxml.reader import read_exf
-from exf2mbfxml.result_codes import FAILED_TO_READ_EXF, MISSING_INPUT_FILE, SUCCESS
-from exf2mbfxml.writer import write_mbfxml
+from exf2mbfxml.batch import convert_file, convert_files, find_input_files, output_file_name, summarise, write_summary
+from exf2mbfxml.cache import DEFAULT_CACHE_SIZE
+from exf2mbfxml.profiling import profile
+from exf2mbfxml.result_codes import SUCCESS, return_codes
+from exf2mbfxml.writer import COMPRESSION_EXTENSIONS
 
 
 def main():
     options = {}
     args = parse_args()
-    if os.path.exists(args.input_exf):
-        if args.output_mbf is None:
-            output_mbf = args.input_exf + '.xml'
-        else:
-            output_mbf = args.output_mbf
-
-        contents = read_exf(args.input_exf)
-        if contents is None:
-            return FAILED_TO_READ_EXF
-        else:
-            write_mbfxml(output_mbf, contents, options)
+    if args.precision is not None:
+        options['precision'] = args.precision
+    if args.write_workers is not None:
+        options['workers'] = args.write_workers
+    if args.compress is not None:
+        options['compression'] = args.compress
+    if args.batch:
+        return _main_batch(args, options)
+
+    input_exf = args.input_exf[0]
+    if args.output_mbf is None:
+        output_mbf = output_file_name(input_exf, compression=args.compress)
+    elif args.output_mbf == '-':
+        output_mbf = sys.stdout.buffer
     else:
-        return MISSING_INPUT_FILE
+        output_mbf = args.output_mbf
+
+    if args.profile is None:
+        return convert_file(input_exf, output_mbf, options, args.cache_dir, args.cache_size, stream=args.stream)
 
-    return SUCCESS
+    with profile() as report:
+        result = convert_file(input_exf, output_mbf, options, args.cache_dir, args.cache_size, stream=args.stream)
+    report.write(args.profile)
+    return result
+
+
+def _main_batch(args, options):
+    input_files = find_input_files(args.input_exf)
+    results = convert_files(input_files, args.output_dir, args.workers, options, args.cache_dir, args.cache_size)
+    if args.summary is None:
+        counts = summarise(results)['counts']
+        for input_exf, result in results.items():
+            print(f'{return_codes[result]}: {input_exf}')
+        print(', '.join(f'{code}={count}' for code, count in counts.items() if count))
+    else:
+        write_summary(args.summary, results)
+
+    failures = [result for result in results.values() if result != SUCCESS]
+    return failures[0] if failures else SUCCESS
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Transform exf format to Neurolucida XML data file.")
-    parser.add_argument("input_exf", help="Location of the input exf file.")
-    parser.add_argument("--output-mbf", help="Location of the output MBF XML file."
+    parser.add_argument("input_exf", nargs="+", help="Location of the input exf file. "
+                                                     "In batch mode, any number of exf files, directories or glob patterns.")
+    parser.add_argument("--output-mbf", help="Location of the output MBF XML file, - writes to standard output."
                                              "[defaults to the location of the input file if not set.]")
+    parser.add_argument("--compress", choices=sorted(COMPRESSION_EXTENSIONS), help="Compress the output MBF XML file, "
+                                                                                   "the compression extension is added to default output file names.")
+    parser.add_argument("--precision", type=int, help="Number of decimal places of the point coordinates and diameters "
+                                                      "[defaults to 2].")
+    parser.add_argument("--write-workers", type=int, help="Number of worker processes for serializing the objects of the output file "
+                                                          "[defaults to the current process].")
+    parser.add_argument("--cache-dir", help="Directory for caching the mesh information read from input files, "
+                                            "repeat conversions of the same input reuse the cached result.")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        help=f"Maximum size of the cache in bytes [defaults to {DEFAULT_CACHE_SIZE}].")
+    parser.add_argument("--stream", action="store_true", help="Write each object of the input file as soon as it is classified, "
+                                                               "in classification order, without using the cache.")
+    parser.add_argument("--profile", help="Location of a JSON file for the wall time, CPU time and peak traced memory of each stage "
+                                          "of the conversion, and the counts of Zinc operations made.")
+    parser.add_argument("--batch", action="store_true", help="Convert all the given exf files, directories and glob patterns.")
+    parser.add_argument("--output-dir", help="Batch mode directory for the output MBF XML files."
+                                             "[defaults to the location of each input file if not set.]")
+    parser.add_argument("--workers", type=int, help="Batch mode number of worker processes [defaults to the number of CPUs].")
+    parser.add_argument("--summary", help="Batch mode location of a JSON file for the result code of each input file."
+                                          "[defaults to printing the result codes if not set.]")
+
+    args = parser.parse_args()
+    if not args.batch and len(args.input_exf) > 1:
+        parser.error("multiple input files require --batch")
+    if args.batch and args.profile is not None:
+        parser.error("--profile is not supported with --batch")
 
-    return parser.parse_args()
+    return args
 
 
 if __name__ == "__main__":  # pragma: no cover
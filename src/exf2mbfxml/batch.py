@@ -0,0 +1,156 @@
+"""
+Convert many EXF files to MBF XML in parallel worker processes.
+
+Each worker process keeps a single Zinc context for its whole lifetime, so the
+interpreter start up and the cmlibs.zinc import are only paid once per worker.
+A file that fails to convert is logged, with its exception, to the exf2mbfxml.batch logger.
+"""
+import glob
+import json
+import logging
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+from cmlibs.zinc.context import Context
+
+from exf2mbfxml.cache import DEFAULT_CACHE_SIZE, read_exf_cached
+from exf2mbfxml.reader import iterate_exf, read_exf
+from exf2mbfxml.result_codes import DUPLICATE_OUTPUT_FILE, FAILED_TO_CONVERT, FAILED_TO_READ_EXF, MISSING_INPUT_FILE, SUCCESS, return_codes
+from exf2mbfxml.writer import COMPRESSION_EXTENSIONS, write_mbfxml, write_mbfxml_items
+
+logger = logging.getLogger(__name__)
+
+_worker_context = None
+_GLOB_CHARACTERS = frozenset('*?[')
+
+
+def find_input_files(inputs):
+    """
+    Expand the given directories, glob patterns and file names into a list of EXF files.
+    Directories are expanded to the EXF files directly inside them. Inputs that match
+    no files are kept, so that they are reported as missing.
+    """
+    input_files = []
+    for input_item in inputs:
+        if os.path.isdir(input_item):
+            input_files.extend(sorted(glob.glob(os.path.join(input_item, '*.exf'))))
+        elif _GLOB_CHARACTERS.intersection(input_item):
+            input_files.extend(sorted(glob.glob(input_item, recursive=True)))
+        else:
+            input_files.append(input_item)
+
+    return list(dict.fromkeys(input_files))
+
+
+def output_file_name(input_exf, output_dir=None, compression=None):
+    output_mbf = input_exf + '.xml' + COMPRESSION_EXTENSIONS.get(compression, '')
+    if output_dir is not None:
+        output_mbf = os.path.join(output_dir, os.path.basename(output_mbf))
+
+    return output_mbf
+
+
+def convert_file(input_exf, output_mbf, options=None, cache_dir=None, cache_size=DEFAULT_CACHE_SIZE, context=None, stream=False):
+    """
+    Convert a single EXF file to MBF XML and return the result code.
+    If stream is True each object is written as soon as it is classified, in classification
+    order, and the cache is not used.
+    """
+    if not os.path.exists(input_exf):
+        return MISSING_INPUT_FILE
+
+    if stream:
+        items = iterate_exf(input_exf, context=context)
+        if items is None:
+            return FAILED_TO_READ_EXF
+
+        write_mbfxml_items(output_mbf, items, {} if options is None else options)
+        return SUCCESS
+
+    if cache_dir is None:
+        contents = read_exf(input_exf, context=context)
+    else:
+        contents = read_exf_cached(input_exf, cache_dir, cache_size, context=context)
+
+    if contents is None:
+        return FAILED_TO_READ_EXF
+
+    write_mbfxml(output_mbf, contents, {} if options is None else options)
+    return SUCCESS
+
+
+def convert_files(input_files, output_dir=None, workers=None, options=None, cache_dir=None, cache_size=DEFAULT_CACHE_SIZE):
+    """
+    Convert the given EXF files to MBF XML using a pool of worker processes.
+
+    :param input_files: List of EXF files to convert.
+    :param output_dir: Directory to write the MBF XML files to, if None each output is written next to its input.
+    :param workers: Number of worker processes, defaults to the number of CPUs. With one worker
+                    the files are converted in the current process.
+    :return: Dictionary of result codes keyed by input file, in the order of the input files.
+             An input with the same output file as an earlier input, such as inputs with the same
+             base name in different directories written to one output_dir, is not converted and
+             gets the DUPLICATE_OUTPUT_FILE result code.
+    """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    compression = None if options is None else options.get('compression')
+    results = {}
+    tasks = []
+    output_files = set()
+    for input_exf in input_files:
+        output_mbf = output_file_name(input_exf, output_dir, compression)
+        output_key = os.path.normcase(os.path.abspath(output_mbf))
+        if output_key in output_files:
+            results[input_exf] = DUPLICATE_OUTPUT_FILE
+        else:
+            output_files.add(output_key)
+            results[input_exf] = None
+            tasks.append((input_exf, output_mbf, options, cache_dir, cache_size))
+
+    if workers == 1 or len(tasks) < 2:
+        _initialise_worker()
+        task_results = [_convert_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_initialise_worker) as executor:
+            task_results = list(executor.map(_convert_task, tasks))
+
+    for task, result in zip(tasks, task_results):
+        results[task[0]] = result
+
+    return results
+
+
+def summarise(results):
+    """
+    Create a summary of the result codes from convert_files.
+    """
+    counts = {code: 0 for code in return_codes}
+    files = []
+    for input_exf, result in results.items():
+        counts[return_codes[result]] += 1
+        files.append({'input': input_exf, 'code': result, 'result': return_codes[result]})
+
+    return {'files': files, 'counts': counts}
+
+
+def write_summary(file_name, results):
+    with open(file_name, 'w') as f:
+        json.dump(summarise(results), f, indent=2)
+
+
+def _initialise_worker():
+    global _worker_context
+    if _worker_context is None:
+        _worker_context = Context("batch")
+
+
+def _convert_task(task):
+    input_exf, output_mbf, options, cache_dir, cache_size = task
+    try:
+        return convert_file(input_exf, output_mbf, options, cache_dir, cache_size, context=_worker_context)
+    except Exception:
+        logger.exception('Failed to convert "%s"', input_exf)
+        return FAILED_TO_CONVERT
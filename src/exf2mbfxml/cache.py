@@ -0,0 +1,134 @@
+"""
+On-disk cache of the classified mesh information read from EXF files.
+
+Entries are keyed by a hash of the input file contents, the read options, the package
+version and the Python interpreter version, so a cached result is reused for any file with
+the same contents read with the same options and discarded when the package or the
+interpreter is updated. The mesh
+information is stored with marshal, which only handles plain Python values, is only
+guaranteed to read data written by the same Python version, and compressed with zlib.
+"""
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import zlib
+
+from exf2mbfxml import __version__ as package_version
+from exf2mbfxml.reader import read_exf
+
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+_CACHE_FILE_EXTENSION = '.mbfcache'
+_HASH_CHUNK_SIZE = 1024 * 1024
+# The marshal format is only stable for a given interpreter implementation and minor version.
+_INTERPRETER = f'{sys.implementation.name} {sys.version_info.major}.{sys.version_info.minor}'
+# The read_exf options changing the result, the Zinc context only holds the region read into.
+_READ_OPTION_DEFAULTS = {'virtual_branches': False, 'native_parser': False}
+
+
+def cache_key(file_name, **read_options):
+    """
+    Create the cache key for the given EXF file from its contents, the read_exf options,
+    the package version and the interpreter version.
+    """
+    options = {name: bool(read_options.get(name, default)) for name, default in _READ_OPTION_DEFAULTS.items()}
+    digest = hashlib.sha256()
+    digest.update(f'exf2mbfxml {package_version} {_INTERPRETER} marshal {marshal.version}\n'.encode('utf-8'))
+    digest.update(f'{sorted(options.items())}\n'.encode('utf-8'))
+    with open(file_name, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def read_exf_cached(file_name, cache_dir, max_cache_size=DEFAULT_CACHE_SIZE, **read_options):
+    """
+    Read the EXF file like read_exf, reusing the mesh information cached in cache_dir
+    from an earlier read of a file with the same contents.
+
+    :param file_name: Location of the EXF file.
+    :param cache_dir: Directory to store the cache entries in, created if it does not exist.
+    :param max_cache_size: Maximum total size in bytes of the cache entries, the least
+                           recently used entries are removed when the cache grows beyond it.
+    :param read_options: Keyword arguments passed on to read_exf.
+    """
+    if not os.path.exists(file_name):
+        return read_exf(file_name, **read_options)
+
+    cache_file = os.path.join(cache_dir, cache_key(file_name, **read_options) + _CACHE_FILE_EXTENSION)
+    mesh_info = _load_entry(cache_file)
+    if mesh_info is not None:
+        return mesh_info
+
+    mesh_info = read_exf(file_name, **read_options)
+    if mesh_info is not None:
+        _store_entry(cache_file, mesh_info)
+        evict(cache_dir, max_cache_size)
+
+    return mesh_info
+
+
+def evict(cache_dir, max_cache_size):
+    """
+    Remove the least recently used cache entries until the total size of the cache is at most max_cache_size.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith(_CACHE_FILE_EXTENSION):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_cache_size:
+            break
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def clear(cache_dir):
+    """
+    Remove all cache entries from cache_dir.
+    """
+    evict(cache_dir, 0)
+
+
+def _load_entry(cache_file):
+    try:
+        with open(cache_file, 'rb') as fh:
+            mesh_info = marshal.loads(zlib.decompress(fh.read()))
+    except (OSError, EOFError, ValueError, TypeError, zlib.error):
+        return None
+
+    # Mark the entry as recently used for eviction.
+    try:
+        os.utime(cache_file)
+    except OSError:
+        pass
+
+    return mesh_info
+
+
+def _store_entry(cache_file, mesh_info):
+    try:
+        data = zlib.compress(marshal.dumps(mesh_info))
+    except ValueError:
+        return
+
+    cache_dir = os.path.dirname(cache_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temporary_file = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.replace(temporary_file, cache_file)
+    except OSError:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
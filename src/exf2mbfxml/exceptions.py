@@ -4,3 +4,7 @@ class EXFException(Exception):
 
 class EXFFile(EXFException):
     pass
+
+
+class EXFUnsupported(EXFException):
+    pass
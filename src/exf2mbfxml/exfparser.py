@@ -0,0 +1,724 @@
+"""
+Streaming parser for the subset of the EXF text format used by 1D line meshes.
+
+The parser reads node values, linear Lagrange line elements with 2 or 3 nodes, groups
+and markers directly into the same structures extract_mesh_info builds from a Zinc
+region. Anything outside of the supported subset, and any text that does not follow
+the format, raises EXFUnsupported, so that the caller can fall back to reading the file with Zinc.
+
+The text is read in chunks of about a megabyte. Headers and templates are read line by line,
+while each run of nodes or elements sharing a template is split into tokens a chunk at a time
+and checked against the fixed layout of the template, and the node values are converted column
+by column into arrays. Only the current chunk of text is held, along with the parsed values.
+"""
+import codecs
+import itertools
+import re
+
+import numpy as np
+
+from exf2mbfxml.exceptions import EXFUnsupported
+from exf2mbfxml.utilities import rgb_to_hex
+
+_CHUNK_SIZE = 1 << 20
+_VALUE_TOKEN_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+_RANGES_PATTERN = re.compile(r'^[\d.,\s]*$')
+_FIELD_COMPONENTS = {'radius': 1, 'rgb': 3, 'resolution': 1}
+# A run of nodes or elements ends at the first line starting with anything other than a value
+# or one of the lines of a node or element definition.
+_NODES_END_PATTERN = re.compile(r'\n(?!Node:)[^\s\d+\-.]')
+_ELEMENTS_END_PATTERN = re.compile(r'\n(?!Element:|Nodes:|Scale factors:)[^\s\d+\-.]')
+
+
+def parse_exf(file_name):
+    """
+    Parse an EXF file into mesh data for reader.extract_parsed_mesh_info.
+
+    :param file_name: Location of the EXF file.
+    :return: Dictionary of analysis elements, node values, groups and markers.
+    """
+    with open(file_name, encoding='utf-8', newline='') as fh:
+        return _parse(iter(lambda: fh.read(_CHUNK_SIZE), ''))
+
+
+def parse_exf_buffer(buffer):
+    """
+    Parse EXF formatted bytes, from a bytes like object or an mmap, into mesh data for reader.extract_parsed_mesh_info.
+    """
+    with memoryview(buffer) as view:
+        return _parse(_buffer_chunks(view))
+
+
+def parse_exf_lines(lines):
+    """
+    Parse EXF formatted text from an iterable of lines into mesh data for reader.extract_parsed_mesh_info.
+    Lines may be either str or UTF-8 encoded bytes.
+    """
+    return _parse(_line_chunks(lines))
+
+
+def _parse(chunks):
+    parser = _EXFParser(chunks)
+    parser.parse()
+    return parser.mesh_data()
+
+
+def _buffer_chunks(view):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for start in range(0, view.nbytes, _CHUNK_SIZE):
+        yield decoder.decode(view[start:start + _CHUNK_SIZE])
+    yield decoder.decode(b'', final=True)
+
+
+def _line_chunks(lines):
+    chunk = []
+    size = 0
+    for line in lines:
+        line = (line.decode('utf-8') if isinstance(line, bytes) else line).rstrip('\r\n')
+        chunk.append(line)
+        size += len(line) + 1
+        if size >= _CHUNK_SIZE:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+            size = 0
+
+    yield '\n'.join(chunk)
+
+
+def _unsupported(message):
+    raise EXFUnsupported(message)
+
+
+def _parse_int(text):
+    try:
+        return int(text)
+    except ValueError:
+        _unsupported(f'Invalid integer: {text}')
+
+
+def _parse_ranges(text):
+    identifiers = []
+    for item in text.replace(' ', '').split(','):
+        if not item:
+            continue
+        if '..' in item:
+            start, _, end = item.partition('..')
+            identifiers.extend(range(_parse_int(start), _parse_int(end) + 1))
+        else:
+            identifiers.append(_parse_int(item))
+
+    return identifiers
+
+
+def _parse_field_header(line):
+    """
+    Parse a field header line into the field name, whether it is a coordinate field,
+    the value type and the number of components.
+    """
+    try:
+        _, definition = line.split(') ', 1)
+    except ValueError:
+        _unsupported(f'Invalid field header: {line}')
+
+    parts = [part.strip() for part in definition.split(',')]
+    if len(parts) == 5 and parts[2] == 'rectangular cartesian' and parts[3] == 'real' and parts[1] in ['coordinate', 'field']:
+        value_type = 'real'
+    elif len(parts) == 4 and parts[1] == 'field' and parts[2] == 'string':
+        value_type = 'string'
+    else:
+        _unsupported(f'Unsupported field definition: {line}')
+
+    if not parts[-1].startswith('#Components='):
+        _unsupported(f'Unsupported field definition: {line}')
+
+    return parts[0], parts[1] == 'coordinate', value_type, _parse_int(parts[-1][len('#Components='):])
+
+
+class _LineReader(object):
+    """
+    Read lines, and runs of lines, from an iterator of text chunks.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._text = ''
+        self._offset = 0
+        self._pushed_back = []
+
+    def _read_chunk(self):
+        """
+        Append the next chunk to the unread text, keeping the character before the unread text
+        for the end patterns, returning False at the end of the text.
+        """
+        try:
+            chunk = next(self._chunks, None)
+        except UnicodeDecodeError as e:
+            _unsupported(f'Cannot decode EXF text: {e}')
+
+        if chunk is None:
+            return False
+
+        keep = max(self._offset - 1, 0)
+        self._text = self._text[keep:] + chunk
+        self._offset -= keep
+        return True
+
+    def next(self):
+        if self._pushed_back:
+            return self._pushed_back.pop()
+
+        while True:
+            end = self._text.find('\n', self._offset)
+            if end == -1:
+                if self._read_chunk():
+                    continue
+                if self._offset >= len(self._text):
+                    return None
+                end = len(self._text)
+
+            line = self._text[self._offset:end].rstrip('\r')
+            self._offset = end + 1
+            if line.strip():
+                return line
+
+    def next_stripped(self):
+        line = self.next()
+        if line is None:
+            _unsupported('Unexpected end of file.')
+
+        return line.strip()
+
+    def blocks(self, end_pattern):
+        """
+        Iterate over the text of the lines up to the next line matched by end_pattern, in pieces
+        made of whole lines.
+        """
+        while True:
+            text = self._text
+            start = self._offset
+            match = end_pattern.search(text, max(start - 1, 0))
+            if match is not None:
+                self._offset = max(match.start() + 1, start)
+                yield text[start:self._offset]
+                return
+
+            # The line after the last line break may not have been read completely.
+            end = text.rfind('\n', start) + 1
+            if end > start:
+                self._offset = end
+                yield text[start:end]
+
+            if not self._read_chunk():
+                yield self._text[self._offset:]
+                self._offset = len(self._text)
+                return
+
+    def push_back(self, line):
+        self._pushed_back.append(line)
+
+    def expect(self, prefix):
+        line = self.next_stripped()
+        if not line.startswith(prefix):
+            _unsupported(f'Expected "{prefix}" but found: {line}')
+
+        return line[len(prefix):].strip()
+
+    def tokens(self, count):
+        """
+        Read the given number of whitespace separated (or quoted) value tokens.
+        """
+        tokens = []
+        while len(tokens) < count:
+            line = self.next()
+            if line is None:
+                _unsupported('Unexpected end of file reading values.')
+            for quoted, plain in _VALUE_TOKEN_PATTERN.findall(line):
+                tokens.append(plain if plain else quoted.replace('\\"', '"'))
+
+        if len(tokens) != count:
+            _unsupported('Values do not match the template.')
+
+        return tokens
+
+
+class _EXFParser(object):
+
+    def __init__(self, chunks):
+        self._reader = _LineReader(chunks)
+        self._domain = None
+        self._group_name = None
+        self._field_definitions = {}
+        self._node_templates = {'nodes': {}, 'datapoints': {}}
+        self._node_template = None
+        self._element_templates = {}
+        self._element_template = None
+        self._node_blocks = {'nodes': [], 'datapoints': []}
+        self._elements = {}
+        self._groups = {}
+
+    def parse(self):
+        reader = self._reader
+        line = reader.next()
+        while line is not None:
+            stripped = line.strip()
+            if stripped.startswith('EX Version:'):
+                if stripped[len('EX Version:'):].strip() != '3':
+                    _unsupported(f'Unsupported EX version: {stripped}')
+            elif stripped.startswith('Region:'):
+                if stripped[len('Region:'):].strip() != '/':
+                    _unsupported(f'Unsupported region: {stripped}')
+                self._group_name = None
+            elif stripped.startswith('!#nodeset'):
+                self._domain = stripped[len('!#nodeset'):].strip()
+                if self._domain not in ['nodes', 'datapoints']:
+                    _unsupported(f'Unsupported nodeset: {stripped}')
+                if self._group_name is not None:
+                    self._parse_group_identifiers('Node group:', self._domain)
+            elif stripped.startswith('!#mesh'):
+                if stripped != '!#mesh mesh1d, dimension=1, nodeset=nodes':
+                    _unsupported(f'Unsupported mesh: {stripped}')
+                self._domain = 'mesh1d'
+                if self._group_name is not None:
+                    self._parse_group_identifiers('Element group:', 'elements')
+            elif stripped.startswith('!'):
+                pass
+            elif stripped.startswith('Group name:'):
+                self._group_name = stripped[len('Group name:'):].strip()
+                self._groups.setdefault(self._group_name, {'nodes': [], 'datapoints': [], 'elements': []})
+            elif self._group_name is not None:
+                _unsupported(f'Unsupported definition in group: {stripped}')
+            elif stripped.startswith('Define node template:'):
+                self._parse_node_template(stripped[len('Define node template:'):].strip())
+            elif stripped.startswith('Node template:'):
+                self._node_template = self._node_templates[self._nodeset()].get(stripped[len('Node template:'):].strip())
+                if self._node_template is None:
+                    _unsupported(f'Undefined node template: {stripped}')
+            elif stripped.startswith('Node:'):
+                self._parse_nodes(stripped)
+            elif stripped.startswith('Define element template:'):
+                self._parse_element_template(stripped[len('Define element template:'):].strip())
+            elif stripped.startswith('Element template:'):
+                self._element_template = self._element_templates.get(stripped[len('Element template:'):].strip())
+                if self._element_template is None:
+                    _unsupported(f'Undefined element template: {stripped}')
+            elif stripped.startswith('Element:'):
+                self._parse_elements(stripped)
+            else:
+                _unsupported(f'Unsupported line: {stripped}')
+
+            line = reader.next()
+
+    def _nodeset(self):
+        if self._domain not in ['nodes', 'datapoints']:
+            _unsupported('Node definition outside of a nodeset.')
+
+        return self._domain
+
+    def _parse_group_identifiers(self, prefix, key):
+        reader = self._reader
+        reader.expect(prefix)
+        identifiers = self._groups[self._group_name][key]
+        line = reader.next()
+        while line is not None and _RANGES_PATTERN.match(line):
+            identifiers.extend(_parse_ranges(line))
+            line = reader.next()
+
+        if line is not None:
+            reader.push_back(line)
+
+    def _define_field(self, name, is_coordinate, value_type, components_count):
+        definition = (is_coordinate, value_type, components_count)
+        if self._field_definitions.setdefault(name, definition) != definition:
+            _unsupported(f'Inconsistent definitions for field: {name}')
+
+    def _parse_node_template(self, name):
+        reader = self._reader
+        if reader.expect('Shape.') != 'Dimension=0':
+            _unsupported('Unsupported node shape.')
+
+        fields = []
+        fields_count = _parse_int(reader.expect('#Fields='))
+        for _ in range(fields_count):
+            field_name, is_coordinate, value_type, components_count = _parse_field_header(reader.next_stripped())
+            self._define_field(field_name, is_coordinate, value_type, components_count)
+            for _ in range(components_count):
+                component = reader.next_stripped()
+                if not component.endswith('. #Values=1 (value)'):
+                    _unsupported(f'Unsupported node field component: {component}')
+            fields.append((field_name, value_type, components_count))
+
+        self._node_templates[self._nodeset()][name] = fields
+
+    def _parse_nodes(self, first_line):
+        """
+        Parse the run of nodes starting with the given node line, up to the next line that is not part of a node.
+        """
+        template = self._node_template
+        if template is None:
+            _unsupported('Node defined without a node template.')
+
+        if any(value_type == 'string' for _, value_type, _ in template):
+            self._parse_node(first_line[len('Node:'):].strip())
+            return
+
+        stride = sum(components_count for _, _, components_count in template) + 2
+        tokens = first_line.split()
+        for text in self._reader.blocks(_NODES_END_PATTERN):
+            tokens += text.split()
+            end = len(tokens) - len(tokens) % stride
+            if end:
+                self._add_nodes(template, tokens[:end], stride)
+                del tokens[:end]
+
+        if tokens:
+            _unsupported('Node values do not match the node template.')
+
+    def _add_nodes(self, template, tokens, stride):
+        count = len(tokens) // stride
+        if tokens[0::stride].count('Node:') != count:
+            _unsupported('Node values do not match the node template.')
+
+        values = np.empty((count, stride - 2))
+        try:
+            identifiers = list(map(int, tokens[1::stride]))
+            for column in range(stride - 2):
+                values[:, column] = list(map(float, tokens[column + 2::stride]))
+        except ValueError:
+            _unsupported('Invalid node identifier or value.')
+
+        self._node_blocks[self._nodeset()].append((identifiers, template, values, {}))
+
+    def _parse_node(self, identifier_text):
+        """
+        Parse a single node with string values, which may be quoted and contain spaces.
+        """
+        template = self._node_template
+        identifier = _parse_int(identifier_text)
+        tokens = self._reader.tokens(sum(components_count for _, _, components_count in template))
+        real_values = []
+        string_values = {}
+        index = 0
+        for field_name, value_type, components_count in template:
+            field_tokens = tokens[index:index + components_count]
+            index += components_count
+            if value_type == 'string':
+                string_values[field_name] = field_tokens[:1]
+            else:
+                real_values.extend(field_tokens)
+
+        try:
+            real_values = np.array([list(map(float, real_values))]).reshape(1, -1)
+        except ValueError:
+            _unsupported('Invalid node value.')
+
+        self._node_blocks[self._nodeset()].append(([identifier], template, real_values, string_values))
+
+    def _parse_element_template(self, name):
+        reader = self._reader
+        if self._domain != 'mesh1d':
+            _unsupported('Element template defined outside of mesh1d.')
+        if reader.expect('Shape.') != 'Dimension=1, line':
+            _unsupported('Unsupported element shape.')
+
+        scale_factor_counts = []
+        scale_factor_sets_count = _parse_int(reader.expect('#Scale factor sets='))
+        for _ in range(scale_factor_sets_count):
+            scale_factor_set = reader.next_stripped()
+            match = re.match(r'^(.+), #Scale factors=(\d+), identifiers=', scale_factor_set)
+            if match is None:
+                _unsupported(f'Unsupported scale factor set: {scale_factor_set}')
+            scale_factor_counts.append(int(match.group(2)))
+        if len(scale_factor_counts) > 1:
+            _unsupported('Multiple scale factor sets are not supported.')
+
+        nodes_count = _parse_int(reader.expect('#Nodes='))
+        scale_factors_count = sum(scale_factor_counts)
+        coordinates_template = None
+        fields_count = _parse_int(reader.expect('#Fields='))
+        for _ in range(fields_count):
+            field_name, is_coordinate, value_type, components_count = _parse_field_header(reader.next_stripped())
+            self._define_field(field_name, is_coordinate, value_type, components_count)
+            component_templates = [self._parse_element_field_component() for _ in range(components_count)]
+            if is_coordinate:
+                if any(component_template != component_templates[0] for component_template in component_templates):
+                    _unsupported('Coordinate components with different interpolation are not supported.')
+                coordinates_template = component_templates[0]
+
+        if coordinates_template is not None:
+            local_nodes_count, functions = coordinates_template
+            if local_nodes_count != nodes_count or local_nodes_count not in [2, 3]:
+                _unsupported(f'Unsupported number of element nodes: {local_nodes_count}')
+            if local_nodes_count == 2 and functions != [[(1, ())], [(2, ())]]:
+                _unsupported('Only linear Lagrange elements on two nodes are supported.')
+            for local_node_index, scaling in itertools.chain.from_iterable(functions):
+                if not 0 < local_node_index <= nodes_count or any(not 0 < index <= scale_factors_count for index in scaling):
+                    _unsupported('Element field terms do not match the element template.')
+
+        self._element_templates[name] = {
+            'nodes_count': nodes_count,
+            'scale_factors_count': scale_factors_count,
+            'coordinates': coordinates_template,
+        }
+
+    def _parse_element_field_component(self):
+        """
+        Parse a linear Lagrange element field component into the number of local nodes and, for
+        each of the two basis functions, the list of terms as local node index and scale factor indices.
+        """
+        reader = self._reader
+        component = reader.next_stripped()
+        if not re.match(r'^\S+\. l\.Lagrange, no modify, standard node based\.( scale factor set=\S+)?$', component):
+            _unsupported(f'Unsupported element field component: {component}')
+
+        local_nodes_count = _parse_int(reader.expect('#Nodes='))
+        functions = []
+        for _ in range(2):
+            node_indices, separator, values_count = reader.next_stripped().partition('. #Values=')
+            if not separator or values_count != '1':
+                _unsupported('Only value parameters are supported.')
+            local_node_indices = [_parse_int(index) for index in node_indices.split('+')]
+            value_labels = reader.expect('Value labels:').split('+')
+            if value_labels != ['value'] * len(local_node_indices):
+                _unsupported(f'Unsupported value labels: {value_labels}')
+
+            scalings = [()] * len(local_node_indices)
+            line = reader.next()
+            if line is not None and line.strip().startswith('Scale factor indices:'):
+                scalings = [tuple(_parse_int(index) for index in scaling.split('*') if index != '0')
+                            for scaling in line.strip()[len('Scale factor indices:'):].strip().split('+')]
+                if len(scalings) != len(local_node_indices):
+                    _unsupported('Scale factor indices do not match the terms.')
+            elif line is not None:
+                reader.push_back(line)
+
+            functions.append(list(zip(local_node_indices, scalings)))
+
+        return local_nodes_count, functions
+
+    def _parse_elements(self, first_line):
+        """
+        Parse the run of elements starting with the given element line, up to the next line that is not part of an element.
+        """
+        template = self._element_template
+        if template is None:
+            _unsupported('Element defined without an element template.')
+
+        # The tokens of each element, None for a node identifier or scale factor.
+        nodes_count = template['nodes_count']
+        scale_factors_count = template['scale_factors_count']
+        layout = ['Element:', None]
+        if nodes_count:
+            layout += ['Nodes:'] + [None] * nodes_count
+        if scale_factors_count:
+            layout += ['Scale', 'factors:'] + [None] * scale_factors_count
+
+        stride = len(layout)
+        tokens = first_line.split()
+        for text in self._reader.blocks(_ELEMENTS_END_PATTERN):
+            tokens += text.split()
+            end = len(tokens) - len(tokens) % stride
+            if end:
+                self._add_elements(template, layout, tokens[:end])
+                del tokens[:end]
+
+        if tokens:
+            _unsupported('Element definitions do not match the element template.')
+
+    def _add_elements(self, template, layout, tokens):
+        stride = len(layout)
+        count = len(tokens) // stride
+        if any(tokens[index::stride].count(label) != count for index, label in enumerate(layout) if label is not None):
+            _unsupported('Element definitions do not match the element template.')
+
+        nodes_count = template['nodes_count']
+        scale_factors_count = template['scale_factors_count']
+        node_identifiers = [()] * count
+        scale_factors = [()] * count
+        try:
+            identifiers = list(map(int, tokens[1::stride]))
+            if nodes_count:
+                node_identifiers = list(zip(*[list(map(int, tokens[3 + index::stride])) for index in range(nodes_count)]))
+            if scale_factors_count:
+                first = stride - scale_factors_count
+                scale_factors = list(zip(*[list(map(float, tokens[first + index::stride])) for index in range(scale_factors_count)]))
+        except ValueError:
+            _unsupported('Invalid element identifier, node or scale factor.')
+
+        self._elements.update(zip(identifiers, zip(itertools.repeat(template), node_identifiers, scale_factors)))
+
+    def _coordinates_field_name(self):
+        coordinate_fields = [name for name, definition in self._field_definitions.items() if definition[0]]
+        if len(coordinate_fields) != 1 or self._field_definitions[coordinate_fields[0]] != (True, 'real', 3):
+            _unsupported('Exactly one three component coordinate field is required.')
+        if coordinate_fields[0] != 'coordinates' and 'coordinates' in self._field_definitions:
+            _unsupported('Non coordinate field named coordinates is not supported.')
+
+        for field_name, components_count in _FIELD_COMPONENTS.items():
+            definition = self._field_definitions.get(field_name)
+            if definition is not None and definition != (False, 'real', components_count):
+                _unsupported(f'Unsupported definition for field: {field_name}')
+
+        return coordinate_fields[0]
+
+    def mesh_data(self):
+        """
+        Assemble the parsed values into the mesh data that the Zinc reader builds from a region.
+        """
+        coordinates_field_name = self._coordinates_field_name()
+        node_values = _NodeValues(self._node_blocks['nodes'])
+
+        elements = self._elements
+        element_identifiers = sorted(elements)
+        invalid_element_identifiers = [element_identifier for element_identifier in element_identifiers if elements[element_identifier][0]['coordinates'] is None]
+        if invalid_element_identifiers:
+            invalid = set(invalid_element_identifiers)
+            element_identifiers = [element_identifier for element_identifier in element_identifiers if element_identifier not in invalid]
+
+        # Nodes are indexed in the order the elements first use them.
+        node_identifiers = list(dict.fromkeys(itertools.chain.from_iterable(elements[element_identifier][1] for element_identifier in element_identifiers)))
+        for node_identifier in node_identifiers:
+            if node_identifier not in node_values:
+                _unsupported(f'Elements use undefined node {node_identifier}.')
+        node_identifier_to_index_map = dict(zip(node_identifiers, range(len(node_identifiers))))
+
+        analysis_elements = []
+        node_element_map = {}
+        linear_element_identifiers = set()
+        for element_identifier in element_identifiers:
+            template, element_node_identifiers, scale_factors = elements[element_identifier]
+            local_nodes_count, functions = template['coordinates']
+            if local_nodes_count == 2:
+                node_element_map[element_node_identifiers] = element_identifier
+                linear_element_identifiers.add(element_identifier)
+                analysis_elements.append({'id': element_identifier, 'start_node': element_node_identifiers[0], 'end_node': element_node_identifiers[1]})
+            else:
+                coordinates = _evaluate_start_coordinates(node_values, functions[0], element_node_identifiers, scale_factors, coordinates_field_name)
+                node_element_key = element_node_identifiers[:2]
+                source_element_identifier = node_element_map.get(node_element_key, node_element_key)
+                analysis_elements.append({'id': element_identifier, 'branch_element': source_element_identifier, 'coordinates': coordinates, 'end_node': element_node_identifiers[2]})
+
+        grouped_identifiers = {}
+        for group_name in sorted(self._groups):
+            group = self._groups[group_name]
+            grouped_identifiers[group_name] = {
+                'nodes': set(sorted(identifier for identifier in group['nodes'] if identifier in node_values)),
+                'elements': set(sorted(identifier for identifier in group['elements'] if identifier in self._elements)),
+            }
+
+        return {
+            'analysis_elements': analysis_elements,
+            'node_element_map': node_element_map,
+            'linear_element_identifiers': linear_element_identifiers,
+            'invalid_element_identifiers': invalid_element_identifiers,
+            'element_identifiers': set(self._elements),
+            'node_identifiers': set(node_values.positions),
+            'node_identifier_to_index_map': node_identifier_to_index_map,
+            'node_table': _create_node_table(node_values, node_values.rows(node_identifiers), coordinates_field_name),
+            'grouped_identifiers': grouped_identifiers,
+            'markers': self._markers(coordinates_field_name),
+        }
+
+    def _markers(self, coordinates_field_name):
+        marker_group = self._groups.get('marker')
+        if marker_group is None:
+            return []
+
+        datapoint_values = _NodeValues(self._node_blocks['datapoints'])
+        datapoint_identifiers = sorted(identifier for identifier in set(marker_group['datapoints']) if identifier in datapoint_values)
+        rows = datapoint_values.rows(datapoint_identifiers)
+        node_table = _create_node_table(datapoint_values, rows, coordinates_field_name)
+        names = datapoint_values.string_values('marker_name', rows)
+        return [{"point": node_table['points'][index].tolist(), "metadata": {"name": names[index], "colour": rgb_to_hex(node_table['colours'][index])}}
+                for index in range(len(datapoint_identifiers))]
+
+
+class _NodeValues(object):
+    """
+    The field values of the nodes of a nodeset, gathered from the blocks of parsed nodes into
+    an array of values and an array of defined flags per real field. A node defined more than
+    once has the values of its last definition.
+    """
+
+    def __init__(self, blocks):
+        identifiers = [identifier for block_identifiers, _, _, _ in blocks for identifier in block_identifiers]
+        self.positions = dict(zip(identifiers, range(len(identifiers))))
+        self._real_values = {}
+        self._string_values = {}
+        start = 0
+        for block_identifiers, template, real_values, string_values in blocks:
+            end = start + len(block_identifiers)
+            column = 0
+            for field_name, value_type, components_count in template:
+                if value_type == 'string':
+                    self._string_values.setdefault(field_name, [None] * len(identifiers))
+                    self._string_values[field_name][start:end] = string_values[field_name]
+                    continue
+
+                if field_name not in self._real_values:
+                    self._real_values[field_name] = (np.zeros((len(identifiers), components_count)), np.zeros(len(identifiers), dtype=bool))
+                values, defined = self._real_values[field_name]
+                values[start:end] = real_values[:, column:column + components_count]
+                defined[start:end] = True
+                column += components_count
+
+            start = end
+
+    def __contains__(self, identifier):
+        return identifier in self.positions
+
+    def rows(self, identifiers):
+        return np.array([self.positions[identifier] for identifier in identifiers], dtype=np.int64)
+
+    def real_values(self, field_name, rows):
+        """
+        Return the values of the real field at the rows, and whether the field is defined at each row.
+        """
+        if field_name not in self._real_values:
+            return np.zeros((len(rows), _FIELD_COMPONENTS.get(field_name, 3))), np.zeros(len(rows), dtype=bool)
+
+        values, defined = self._real_values[field_name]
+        return values[rows], defined[rows]
+
+    def string_values(self, field_name, rows):
+        values = self._string_values.get(field_name)
+        return [None] * len(rows) if values is None else [values[row] for row in rows.tolist()]
+
+
+def _evaluate_start_coordinates(node_values, function_terms, element_node_identifiers, scale_factors, coordinates_field_name):
+    rows = node_values.rows([element_node_identifiers[local_node_index - 1] for local_node_index, _ in function_terms])
+    values, defined = node_values.real_values(coordinates_field_name, rows)
+    if not defined.all():
+        return None
+
+    coordinates = [0.0, 0.0, 0.0]
+    for (_, scaling), term_values in zip(function_terms, values.tolist()):
+        scale = 1.0
+        for scale_factor_index in scaling:
+            scale *= scale_factors[scale_factor_index - 1]
+        coordinates = [coordinate + scale * value for coordinate, value in zip(coordinates, term_values)]
+
+    return coordinates
+
+
+def _create_node_table(node_values, rows, coordinates_field_name):
+    """
+    Create a node table, matching zinc.get_node_table, from the parsed values of the nodes at the rows.
+    """
+    points = np.empty((len(rows), 4))
+    points[:, :3] = -1.0
+    points[:, 3] = 1.0
+    coordinates, has_coordinates = node_values.real_values(coordinates_field_name, rows)
+    radius, has_radius = node_values.real_values('radius', rows)
+    points[has_coordinates, :3] = coordinates[has_coordinates]
+    has_diameter = has_coordinates & has_radius
+    points[has_diameter, 3] = 2 * radius[has_diameter, 0]
+
+    colours = np.ones((len(rows), 3))
+    rgb, has_rgb = node_values.real_values('rgb', rows)
+    colours[has_rgb] = rgb[has_rgb]
+
+    resolutions = np.full(len(rows), np.nan)
+    resolution, has_resolution = node_values.real_values('resolution', rows)
+    resolutions[has_resolution] = resolution[has_resolution, 0]
+
+    return {'points': points, 'colours': colours, 'resolutions': resolutions}
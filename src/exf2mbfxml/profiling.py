@@ -0,0 +1,194 @@
+"""
+Stage level profiling of conversions.
+
+While a profile is active, the conversion pipeline records the wall time, CPU time and peak
+traced memory of each stage it runs, and the Zinc Fieldcache creations, field evaluations and
+elements created are counted. With no active profile the stages cost a single check::
+
+    with profile() as report:
+        read_exf(file_name)
+    report.write('profile.json')
+
+Stage measurements are inclusive of the stages run within them, and a stage run more than once
+accumulates its times and keeps the largest peak. The peak memory is the peak of the memory traced
+by tracemalloc above the traced memory at the start of the stage, memory allocated by Zinc itself
+and by worker processes is not traced. The Zinc counters are made by wrapping the Zinc methods for
+the duration of the profile, so only one profile should be active at a time.
+"""
+import contextlib
+import json
+import time
+import tracemalloc
+
+from cmlibs.zinc.element import Mesh
+from cmlibs.zinc.field import Field
+from cmlibs.zinc.fieldmodule import Fieldmodule
+
+_COUNTED_METHODS = [
+    (Fieldmodule, 'createFieldcache', 'fieldcache_creations'),
+    (Field, 'evaluateReal', 'field_evaluations'),
+    (Field, 'evaluateString', 'field_evaluations'),
+    (Field, 'evaluateDerivative', 'field_evaluations'),
+    (Field, 'evaluateMeshLocation', 'field_evaluations'),
+    (Mesh, 'createElement', 'elements_created'),
+]
+
+_active_profile = None
+
+
+class Profile(object):
+    """
+    Measurements of the stages of a conversion and counts of the Zinc operations made.
+
+    If given, callback is called with the stage name and its measurements each time a stage ends.
+    """
+
+    def __init__(self, callback=None, trace_memory=True):
+        self._callback = callback
+        self._trace_memory = trace_memory
+        self._stages = {}
+        self._open_stages = []
+        self.counters = {counter: 0 for _, _, counter in _COUNTED_METHODS}
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Measure the stage with the given name for the duration of the context.
+        """
+        entry = self._start_stage()
+        try:
+            yield
+        finally:
+            self._end_stage(name, entry)
+
+    def _start_stage(self):
+        start_memory = 0
+        if self._trace_memory and tracemalloc.is_tracing():
+            start_memory, peak = tracemalloc.get_traced_memory()
+            if self._open_stages:
+                self._open_stages[-1]['peak'] = max(self._open_stages[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+
+        entry = {'start_memory': start_memory, 'peak': start_memory, 'wall_time': time.perf_counter(), 'cpu_time': time.process_time()}
+        self._open_stages.append(entry)
+        return entry
+
+    def _end_stage(self, name, entry):
+        wall_time = time.perf_counter() - entry['wall_time']
+        cpu_time = time.process_time() - entry['cpu_time']
+        if self._trace_memory and tracemalloc.is_tracing():
+            entry['peak'] = max(entry['peak'], tracemalloc.get_traced_memory()[1])
+
+        self._open_stages.pop()
+        if self._open_stages:
+            self._open_stages[-1]['peak'] = max(self._open_stages[-1]['peak'], entry['peak'])
+
+        record = self._stages.setdefault(name, {'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'peak_memory': 0})
+        record['calls'] += 1
+        record['wall_time'] += wall_time
+        record['cpu_time'] += cpu_time
+        record['peak_memory'] = max(record['peak_memory'], entry['peak'] - entry['start_memory'])
+        if self._callback is not None:
+            self._callback(name, dict(record))
+
+    def stages(self):
+        """
+        Return the measurements of each stage, in the order the stages first ended.
+        """
+        return {name: dict(record) for name, record in self._stages.items()}
+
+    def to_dict(self):
+        return {
+            'wall_time': self.wall_time,
+            'cpu_time': self.cpu_time,
+            'stages': self.stages(),
+            'counters': dict(self.counters),
+        }
+
+    def write(self, output):
+        """
+        Write the report as JSON to a file name or a text file-like object.
+        """
+        if hasattr(output, 'write'):
+            json.dump(self.to_dict(), output, indent=2)
+        else:
+            with open(output, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2)
+
+
+@contextlib.contextmanager
+def profile(callback=None, trace_memory=True):
+    """
+    Profile the conversions run in the context, yielding the Profile holding the measurements.
+    Memory is traced with tracemalloc if trace_memory is True, which slows the conversion down.
+    """
+    global _active_profile
+    report = Profile(callback, trace_memory)
+    previous_profile = _active_profile
+    start_tracing = trace_memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+
+    wall_time = time.perf_counter()
+    cpu_time = time.process_time()
+    _active_profile = report
+    try:
+        with _count_zinc_methods(report.counters):
+            yield report
+    finally:
+        _active_profile = previous_profile
+        report.wall_time = time.perf_counter() - wall_time
+        report.cpu_time = time.process_time() - cpu_time
+        if start_tracing:
+            tracemalloc.stop()
+
+
+def stage(name):
+    """
+    Return a context measuring the stage with the given name in the active profile, if any.
+    """
+    if _active_profile is None:
+        return contextlib.nullcontext()
+
+    return _active_profile.stage(name)
+
+
+def stage_iterator(name, items):
+    """
+    Iterate over the items, measuring the time taken to produce each item as part of the stage
+    with the given name in the profile active at the time, if any.
+    """
+    iterator = iter(items)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+
+        yield item
+
+
+@contextlib.contextmanager
+def _count_zinc_methods(counters):
+    originals = []
+    for cls, name, counter in _COUNTED_METHODS:
+        method = cls.__dict__[name]
+        originals.append((cls, name, method))
+        setattr(cls, name, _counted(method, counters, counter))
+
+    try:
+        yield
+    finally:
+        for cls, name, method in originals:
+            setattr(cls, name, method)
+
+
+def _counted(method, counters, counter):
+    def counted_method(*args, **kwargs):
+        counters[counter] += 1
+        return method(*args, **kwargs)
+
+    return counted_method
@@ -1,60 +1,222 @@
+import mmap
 import os
 
+import numpy as np
+
 from cmlibs.utils.zinc.finiteelement import create_element_from_node_identifiers
 from cmlibs.utils.zinc.general import ChangeManager, AbstractNodeDataObject, create_node
 from cmlibs.zinc.context import Context
 from cmlibs.zinc.field import FieldFindMeshLocation, Field
 from cmlibs.zinc.result import RESULT_OK
 
-from exf2mbfxml.analysis import determine_forest, classify_forest, read_markers
-from exf2mbfxml.exceptions import EXFFile
-from exf2mbfxml.utilities import determine_fields
-from exf2mbfxml.zinc import get_group_elements_and_nodes
-
-
-def read_exf(file_name):
+from exf2mbfxml.analysis import determine_forest, iterate_forest, read_markers
+from exf2mbfxml.exceptions import EXFFile, EXFUnsupported
+from exf2mbfxml.exfparser import parse_exf, parse_exf_buffer, parse_exf_lines
+from exf2mbfxml.profiling import stage
+from exf2mbfxml.utilities import determine_fields, project_points_onto_segments
+from exf2mbfxml.zinc import get_group_elements_and_nodes, get_node_identifiers, get_node_table, is_linear_lagrange_template
+
+
+def read_exf(file_name, virtual_branches=False, native_parser=False, context=None):
+    """
+    Read the EXF file and extract the contours, trees, vessels and markers from it.
+    The file is read into a new region of the given Zinc context, or of a new context if none is given.
+
+    If native_parser is True the file is read with the pure Python EXF parser, which
+    only supports the subset of the EXF format needed for 1D line meshes. Files using
+    anything outside of that subset are read with Zinc instead.
+    """
+    with stage('read_exf'):
+        return _collect_mesh_info(iterate_exf(file_name, virtual_branches, native_parser, context))
+
+
+def iterate_exf(file_name, virtual_branches=False, native_parser=False, context=None):
+    """
+    Read the EXF file like read_exf, returning an iterator of the category and the item for
+    each marker, contour, tree and vessel. The markers come first, then the classified plants
+    in the order they are classified, so only one plant is held in memory at a time.
+    The file is read and the forest determined before returning, None is returned if the file
+    cannot be read.
+    """
     if os.path.exists(file_name):
-        context = Context("read")
+        if native_parser:
+            try:
+                with stage('parse_exf'):
+                    mesh_data = parse_exf(file_name)
+                return iterate_parsed_mesh_info(mesh_data)
+            except EXFUnsupported:
+                pass
+
+        if context is None:
+            context = Context("read")
         region = context.createRegion()
-        result = region.readFile(file_name)
+        with stage('readFile'):
+            result = region.readFile(file_name)
         if result != RESULT_OK:
             return None
 
-        return extract_mesh_info(region)
+        return iterate_mesh_info(region, virtual_branches=virtual_branches)
 
     raise EXFFile(f'File does not exist: "{file_name}"')
 
 
-def extract_mesh_info(region):
+def read_exf_buffer(source, virtual_branches=False, native_parser=False, context=None):
+    """
+    Read EXF formatted data from memory and extract the contours, trees, vessels and markers from it.
+
+    The source can be bytes, a bytearray, a memoryview, an mmap or a file-like object opened in
+    binary or text mode. The Zinc memory buffer stream resource only accepts bytes, so other
+    sources are copied once when they are read with Zinc. The native parser reads the
+    source in chunks without making a copy of it.
+    """
+    with stage('read_exf'):
+        return _read_exf_buffer(source, virtual_branches, native_parser, context)
+
+
+def _read_exf_buffer(source, virtual_branches, native_parser, context):
+    if hasattr(source, 'read') and not isinstance(source, mmap.mmap):
+        if native_parser and source.seekable():
+            position = source.tell()
+            try:
+                with stage('parse_exf'):
+                    mesh_data = parse_exf_lines(source)
+                return extract_parsed_mesh_info(mesh_data)
+            except EXFUnsupported:
+                source.seek(position)
+                native_parser = False
+
+        source = source.read()
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+
+    if native_parser:
+        try:
+            with stage('parse_exf'):
+                mesh_data = parse_exf_buffer(source)
+            return extract_parsed_mesh_info(mesh_data)
+        except EXFUnsupported:
+            pass
+
+    buffer = source if isinstance(source, bytes) else bytes(source)
+    if context is None:
+        context = Context("read")
+    region = context.createRegion()
+    stream_information = region.createStreaminformationRegion()
+    stream_information.createStreamresourceMemoryBuffer(buffer)
+    with stage('readFile'):
+        result = region.read(stream_information)
+    if result != RESULT_OK:
+        return None
+
+    return extract_mesh_info(region, virtual_branches=virtual_branches)
+
+
+def extract_mesh_info(region, virtual_branches=False):
+    """
+    Extract the contours, trees, vessels and markers from the 1D mesh in the given region.
+
+    Branch points of 3 node elements split their parent element. By default the new nodes
+    and elements are created in the region, if virtual_branches is True the parent elements
+    are split using synthetic identifiers only and the region is left unchanged.
+    """
+    return _collect_mesh_info(iterate_mesh_info(region, virtual_branches))
+
+
+def iterate_mesh_info(region, virtual_branches=False):
+    """
+    Extract the markers, contours, trees and vessels from the region like extract_mesh_info,
+    returning an iterator of the category and the item for each of them.
+    """
+    with stage('extract_mesh_info'):
+        return _iterate_region_mesh_info(region, virtual_branches)
+
+
+def _iterate_region_mesh_info(region, virtual_branches):
     field_module = region.getFieldmodule()
     mesh_1d = field_module.findMeshByDimension(1)
-    analysis_elements = [None] * mesh_1d.getSize()
-    element_iterator = mesh_1d.createElementiterator()
-    element = element_iterator.next()
-    if not element.isValid():
+    if mesh_1d.getSize() == 0:
         return None
 
-    index = 0
     coordinates_field, available_fields, group_fields = determine_fields(field_module)
     data_fields = {available_field.getName(): available_field for available_field in available_fields}
-    grouped_identifiers = get_group_elements_and_nodes(group_fields)
 
     # _print_check_on_field_names(available_fields)
 
+    mesh_data = _read_mesh_data(mesh_1d, coordinates_field, data_fields)
+    mesh_data['grouped_identifiers'] = get_group_elements_and_nodes(group_fields)
+
+    if virtual_branches:
+        node_set = field_module.findNodesetByFieldDomainType(Field.DOMAIN_TYPE_NODES)
+        branch_creators = _virtual_branch_creators(get_node_identifiers(node_set), mesh_data['element_identifiers'])
+    else:
+        branch_creators = _region_branch_creators(field_module, mesh_1d, coordinates_field)
+
+    with stage('read_markers'):
+        markers = read_markers(region, data_fields)
+    plants = _analyse_mesh_data(mesh_data, branch_creators, _zinc_branch_locator(field_module, coordinates_field),
+                                _zinc_linear_element_test(mesh_1d, coordinates_field))
+    return _iterate_items(markers, plants)
+
+
+def extract_parsed_mesh_info(mesh_data):
+    """
+    Extract the contours, trees, vessels and markers from mesh data created by the native EXF parser.
+    The parent elements of branch points are always split virtually.
+    """
+    return _collect_mesh_info(iterate_parsed_mesh_info(mesh_data))
+
+
+def iterate_parsed_mesh_info(mesh_data):
+    """
+    Extract the markers, contours, trees and vessels from mesh data created by the native EXF parser
+    like extract_parsed_mesh_info, returning an iterator of the category and the item for each of them.
+    """
+    if not mesh_data['element_identifiers']:
+        return None
+
+    with stage('extract_mesh_info'):
+        branch_creators = _virtual_branch_creators(mesh_data['node_identifiers'], mesh_data['element_identifiers'])
+        plants = _analyse_mesh_data(mesh_data, branch_creators)
+    return _iterate_items(mesh_data['markers'], plants)
+
+
+def _iterate_items(markers, plants):
+    for marker in markers:
+        yield 'markers', marker
+
+    yield from plants
+
+
+def _collect_mesh_info(items):
+    if items is None:
+        return None
+
+    mesh_info = {'contours': [], 'trees': [], 'vessels': [], 'markers': []}
+    for category, item in items:
+        mesh_info[category].append(item)
+
+    return mesh_info
+
+
+def _read_mesh_data(mesh_1d, coordinates_field, data_fields):
+    """
+    Read the analysis elements and node values from the 1D mesh of a Zinc region.
+    """
+    analysis_elements = []
     node_element_map = {}
-    element_identifier_to_index_map = {}
     invalid_element_identifiers = []
     nodes = []
     node_identifier_to_index_map = {}
-    visited_elements = set()
+    element_identifiers = set()
+    element_iterator = mesh_1d.createElementiterator()
+    element = element_iterator.next()
     while element.isValid():
         element_identifier = element.getIdentifier()
-        visited_elements.add(element_identifier)
+        element_identifiers.add(element_identifier)
         eft = element.getElementfieldtemplate(coordinates_field, -1)
         if eft.isValid():
             local_nodes_count = eft.getNumberOfLocalNodes()
-            if local_nodes_count == 2:
-                visited_elements.remove(element_identifier)
+            if local_nodes_count in [2, 3]:
                 local_node_identifiers = []
                 for i in range(local_nodes_count):
                     node = element.getNode(eft, i + 1)
@@ -64,134 +226,287 @@ def extract_mesh_info(region):
                         nodes.append(node)
 
                     local_node_identifiers.append(node_identifier)
+
+            if local_nodes_count == 2:
                 node_element_map[tuple(local_node_identifiers)] = element_identifier
-                analysis_elements[index] = {'id': element_identifier, 'start_node': local_node_identifiers[0], 'end_node': local_node_identifiers[1]}
-                element_identifier_to_index_map[element_identifier] = index
+                analysis_elements.append({'id': element_identifier, 'start_node': local_node_identifiers[0], 'end_node': local_node_identifiers[1]})
             elif local_nodes_count == 3:
                 coordinates = _evaluate_field_data(element, 0.0, coordinates_field)
-                local_nodes_count = eft.getNumberOfLocalNodes()
-                local_node_identifiers = []
-                for i in range(local_nodes_count):
-                    node = element.getNode(eft, i + 1)
-
-                    node_identifier = node.getIdentifier()
-                    if node_identifier not in node_identifier_to_index_map:
-                        node_identifier_to_index_map[node_identifier] = len(nodes)
-                        nodes.append(node)
-
-                    local_node_identifiers.append(node_identifier)
-
                 node_element_key = tuple(local_node_identifiers[:2])
                 source_element_identifier = node_element_map.get(node_element_key, node_element_key)
-                analysis_elements[index] = {'id': element_identifier, 'branch_element': source_element_identifier, 'coordinates': coordinates, 'end_node': local_node_identifiers[2],}
+                analysis_elements.append({'id': element_identifier, 'branch_element': source_element_identifier, 'coordinates': coordinates, 'end_node': local_node_identifiers[2]})
             else:
                 print(f'Invalid number of local nodes: {eft.getNumberOfLocalNodes()}')
         else:
             invalid_element_identifiers.append(element_identifier)
 
         element = element_iterator.next()
-        index += 1
 
-    # Clean up analysis elements.
-    analysis_elements = [item for item in analysis_elements if item is not None]
+    return {
+        'analysis_elements': analysis_elements,
+        'node_element_map': node_element_map,
+        'invalid_element_identifiers': invalid_element_identifiers,
+        'element_identifiers': element_identifiers,
+        'node_identifier_to_index_map': node_identifier_to_index_map,
+        # Evaluate all the node values in one pass, rows are indexed by node_identifier_to_index_map.
+        'node_table': get_node_table(nodes, data_fields),
+    }
+
+
+def _analyse_mesh_data(mesh_data, branch_creators, general_branch_locator=None, linear_element_test=None):
+    """
+    Split the parent elements at the branch points of 3 node elements, then determine and classify the forest.
+
+    :param mesh_data: Dictionary of analysis elements, node values and groups read from Zinc or the native parser.
+    :param branch_creators: Tuple of functions creating a branch node from coordinates and a branch element from node identifiers.
+    :param general_branch_locator: Function locating branch points on parent elements that are not linear.
+    :param linear_element_test: Function deciding if a parent element is linear Lagrange, defaults to
+                                membership of the linear_element_identifiers of the mesh data.
+    :return: Iterator of the category and the item for each classified contour, tree and vessel.
+    """
+    analysis_elements = mesh_data['analysis_elements']
+    node_identifier_to_index_map = mesh_data['node_identifier_to_index_map']
+    node_table = mesh_data['node_table']
+    grouped_identifiers = mesh_data['grouped_identifiers']
 
     # Find branching points for 3 node elements.
+    if linear_element_test is None:
+        linear_element_test = mesh_data['linear_element_identifiers'].__contains__
+    branch_locations = _locate_branch_points(analysis_elements, mesh_data['node_element_map'], linear_element_test,
+                                             node_table, node_identifier_to_index_map, general_branch_locator)
     replaced_elements = {}
     branches = {}
-    with ChangeManager(field_module):
-        mesh_cache = field_module.createFieldcache()
-        find_mesh_location = field_module.createFieldFindMeshLocation(coordinates_field, coordinates_field, mesh_1d)
-        find_mesh_location.setSearchMode(FieldFindMeshLocation.SEARCH_MODE_NEAREST)
-        field_group = field_module.createFieldGroup()
-        mesh_group = field_group.getOrCreateMeshGroup(mesh_1d)
-
-        for index, item in enumerate(analysis_elements):
-            if 'branch_element' in item:
-                branch_element = node_element_map[item['branch_element']] if isinstance(item['branch_element'], tuple) else item['branch_element']
-                element = mesh_1d.findElementByIdentifier(branch_element)
-                mesh_group.addElement(element)
-                find_mesh_location.setSearchMesh(mesh_group)
+    for item in analysis_elements:
+        if 'branch_element' in item:
+            branch_element, xi, start_coordinates = branch_locations[item['id']]
+            item['branch_location'] = xi
 
-                mesh_cache.setFieldReal(coordinates_field, item['coordinates'])
-                search_element, xi = find_mesh_location.evaluateMeshLocation(mesh_cache, 1)
-                mesh_cache.setMeshLocation(search_element, xi)
-                _, start_coordinates = coordinates_field.evaluateReal(mesh_cache, 3)
-                item['branch_location'] = xi
-                mesh_group.removeElement(element)
-
-                branches.setdefault(branch_element, []).append((xi, start_coordinates, item['end_node'], item['id']))
-                replaced_elements[item['id']] = set()
+            branches.setdefault(branch_element, []).append((xi, start_coordinates, item['end_node'], item['id']))
+            replaced_elements[item['id']] = set()
 
     # Replace virtual nodes with physical nodes and adjust the element into line segments
     # that connects the branch nodes into the original element.
-    remove_indices = []
-    node_set = field_module.findNodesetByFieldDomainType(Field.DOMAIN_TYPE_NODES)
-    node_data = AbstractNodeDataObject([coordinates_field.getName()])
+    create_branch_node, create_branch_element = branch_creators
+    element_lookup = {item['id']: item for item in analysis_elements}
+    created_node_coordinates = []
     for branch_element, xi_list in branches.items():
         sorted_xi_list = sorted(xi_list, key=lambda x: x[0])
-        index = 0
-        replace_index = element_identifier_to_index_map[branch_element]
-        remove_indices.append(replace_index)
         replaced_elements[branch_element] = set()
-        start_node = analysis_elements[replace_index]['start_node']
-        final_end_node = analysis_elements[replace_index]['end_node']
+        start_node = element_lookup[branch_element]['start_node']
+        final_end_node = element_lookup[branch_element]['end_node']
         for xi, coordinates, end_node, identifier in sorted_xi_list:
-            current_coordinates = coordinates
-            setattr(node_data, coordinates_field.getName(), lambda: current_coordinates)
-            node_identifier = create_node(field_module, node_data)
+            node_identifier = create_branch_node(coordinates)
             if node_identifier not in node_identifier_to_index_map:
-                node_identifier_to_index_map[node_identifier] = len(nodes)
-                node = node_set.findNodeByIdentifier(node_identifier)
-                nodes.append(node)
-            index += 1
+                node_identifier_to_index_map[node_identifier] = len(node_identifier_to_index_map)
+                created_node_coordinates.append(coordinates)
 
             # Create the connecting element from the start node to the new branch node.
-            element_identifier = create_element_from_node_identifiers(mesh_1d, coordinates_field, [start_node, node_identifier])
+            element_identifier = create_branch_element([start_node, node_identifier])
             analysis_elements.append({'id': element_identifier, 'start_node': start_node, 'end_node': node_identifier})
             replaced_elements[branch_element].add(element_identifier)
 
             # Create the branch element.
-            element_identifier = create_element_from_node_identifiers(mesh_1d, coordinates_field, [node_identifier, end_node])
+            element_identifier = create_branch_element([node_identifier, end_node])
             analysis_elements.append({'id': element_identifier, 'start_node': node_identifier, 'end_node': end_node})
             start_node = node_identifier
             replaced_elements[identifier].add(element_identifier)
 
         # Create the connecting element from the branch node to the end of the original element.
-        element_identifier = create_element_from_node_identifiers(mesh_1d, coordinates_field, [start_node, final_end_node])
+        element_identifier = create_branch_element([start_node, final_end_node])
         analysis_elements.append({'id': element_identifier, 'start_node': start_node, 'end_node': final_end_node})
         replaced_elements[branch_element].add(element_identifier)
 
-    for index in reversed(sorted(remove_indices)):
-        del analysis_elements[index]
+    # Filter out all the replaced parent elements and branch elements.
+    analysis_elements = [item for item in analysis_elements if 'branch_element' not in item and item['id'] not in branches]
 
-    # Filter out all the replaced branch elements.
-    analysis_elements = [item for item in analysis_elements if 'branch_element' not in item]
+    # Clean up group_identifiers
+    _update_grouped_identifiers(grouped_identifiers, mesh_data['invalid_element_identifiers'], replaced_elements, analysis_elements)
 
-    # Re-create element_identifier_to_index_map = {}
-    element_identifier_to_index_map = {item['id']: index for index, item in enumerate(analysis_elements)}
+    with stage('determine_forest'):
+        forest, group_start_nodes = determine_forest(analysis_elements, grouped_identifiers)
 
-    # Clean up group_identifiers
-    for group in grouped_identifiers:
-        grouped_identifiers[group]['elements'] -= set(invalid_element_identifiers)
-        for key, value in replaced_elements.items():
-            if key in grouped_identifiers[group]['elements']:
-                grouped_identifiers[group]['elements'].remove(key)
-                grouped_identifiers[group]['elements'].update(value)
-
-        grouped_identifiers[group]['nodes'] = set()
-        for element_identifier in grouped_identifiers[group]['elements']:
-            index = element_identifier_to_index_map[element_identifier]
-            analysis_element = analysis_elements[index]
-            grouped_identifiers[group]['nodes'].add(analysis_element['start_node'])
-            grouped_identifiers[group]['nodes'].add(analysis_element['end_node'])
-
-    forest, group_start_nodes = determine_forest(analysis_elements, grouped_identifiers)
+    node_table = _extend_node_table(node_table, created_node_coordinates)
 
     grouped_nodes = {k: v['nodes'] for k, v in grouped_identifiers.items()}
-    mesh_info = classify_forest(forest, nodes, node_identifier_to_index_map, data_fields, grouped_nodes, group_start_nodes)
+    return iterate_forest(forest, node_table, node_identifier_to_index_map, grouped_nodes, group_start_nodes)
+
+
+def _update_grouped_identifiers(grouped_identifiers, invalid_element_identifiers, replaced_elements, analysis_elements):
+    """
+    Remove invalid elements from the groups, swap replaced elements for their replacements
+    and rebuild the group nodes from the group elements. An inverted element to groups index
+    is used so the cost scales with the size of the group memberships.
+    """
+    element_groups = {}
+    for group in grouped_identifiers.values():
+        for element_identifier in group['elements']:
+            element_groups.setdefault(element_identifier, []).append(group)
+
+    for element_identifier in invalid_element_identifiers:
+        for group in element_groups.get(element_identifier, []):
+            group['elements'].discard(element_identifier)
+
+    for key, value in replaced_elements.items():
+        for group in element_groups.get(key, []):
+            group['elements'].remove(key)
+            group['elements'].update(value)
+
+    element_lookup = {item['id']: item for item in analysis_elements}
+    for group in grouped_identifiers.values():
+        group_nodes = set()
+        for element_identifier in group['elements']:
+            analysis_element = element_lookup[element_identifier]
+            group_nodes.add(analysis_element['start_node'])
+            group_nodes.add(analysis_element['end_node'])
+        group['nodes'] = group_nodes
+
+
+def _locate_branch_points(analysis_elements, node_element_map, linear_element_test, node_table, node_identifier_to_index_map, general_branch_locator):
+    """
+    Find the location on the parent element of the start of every 3 node branch element.
+    Branches from linear parent elements are projected analytically in one batch using
+    the node table, branches from any other parent element are given to the general branch locator.
+
+    :return: Dictionary of branch element identifier to a tuple of parent element identifier, xi and coordinates.
+    """
+    element_lookup = {item['id']: item for item in analysis_elements if 'start_node' in item}
+    linear_branch_items = []
+    general_branch_items = []
+    for item in analysis_elements:
+        if 'branch_element' in item:
+            branch_element = node_element_map[item['branch_element']] if isinstance(item['branch_element'], tuple) else item['branch_element']
+            if linear_element_test(branch_element):
+                linear_branch_items.append((item, branch_element))
+            else:
+                general_branch_items.append((item, branch_element))
+
+    branch_locations = {}
+    if linear_branch_items:
+        parent_elements = [element_lookup[branch_element] for _, branch_element in linear_branch_items]
+        start_indices = [node_identifier_to_index_map[parent_element['start_node']] for parent_element in parent_elements]
+        end_indices = [node_identifier_to_index_map[parent_element['end_node']] for parent_element in parent_elements]
+        node_coordinates = node_table['points'][:, :3]
+        xi_values, projected_coordinates = project_points_onto_segments(
+            [item['coordinates'] for item, _ in linear_branch_items], node_coordinates[start_indices], node_coordinates[end_indices])
+        for (item, branch_element), xi, start_coordinates in zip(linear_branch_items, xi_values.tolist(), projected_coordinates.tolist()):
+            branch_locations[item['id']] = (branch_element, xi, start_coordinates)
+
+    if general_branch_items:
+        branch_locations.update(general_branch_locator(general_branch_items))
+
+    return branch_locations
+
+
+def _zinc_linear_element_test(mesh_1d, coordinates_field):
+    """
+    Create a function deciding if the coordinates of an element are interpolated linearly. Only the parent
+    elements of branch points are tested, so the result is worked out when it is first needed for each element.
+    """
+    results = {}
+
+    def is_linear_element(element_identifier):
+        result = results.get(element_identifier)
+        if result is None:
+            eft = mesh_1d.findElementByIdentifier(element_identifier).getElementfieldtemplate(coordinates_field, -1)
+            result = results[element_identifier] = eft.isValid() and is_linear_lagrange_template(eft)
+
+        return result
+
+    return is_linear_element
+
+
+def _zinc_branch_locator(field_module, coordinates_field):
+    """
+    Create a function that locates branch points on their parent elements with a Zinc nearest mesh location search.
+    """
+    def locate_branch_points(branch_items):
+        branch_locations = {}
+        mesh_1d = field_module.findMeshByDimension(1)
+        with ChangeManager(field_module):
+            mesh_cache = field_module.createFieldcache()
+            find_mesh_location = field_module.createFieldFindMeshLocation(coordinates_field, coordinates_field, mesh_1d)
+            find_mesh_location.setSearchMode(FieldFindMeshLocation.SEARCH_MODE_NEAREST)
+            field_group = field_module.createFieldGroup()
+            mesh_group = field_group.getOrCreateMeshGroup(mesh_1d)
+
+            for item, branch_element in branch_items:
+                element = mesh_1d.findElementByIdentifier(branch_element)
+                mesh_group.addElement(element)
+                find_mesh_location.setSearchMesh(mesh_group)
 
-    mesh_info['markers'] = read_markers(region, data_fields)
-    return mesh_info
+                mesh_cache.setFieldReal(coordinates_field, item['coordinates'])
+                search_element, xi = find_mesh_location.evaluateMeshLocation(mesh_cache, 1)
+                mesh_cache.setMeshLocation(search_element, xi)
+                _, start_coordinates = coordinates_field.evaluateReal(mesh_cache, 3)
+                mesh_group.removeElement(element)
+
+                branch_locations[item['id']] = (branch_element, xi, start_coordinates)
+
+        return branch_locations
+
+    return locate_branch_points
+
+
+def _region_branch_creators(field_module, mesh, coordinates_field):
+    """
+    Create functions that make the branch nodes and elements in the region.
+    """
+    node_data = AbstractNodeDataObject([coordinates_field.getName()])
+
+    def create_branch_node(coordinates):
+        setattr(node_data, coordinates_field.getName(), lambda: coordinates)
+        return create_node(field_module, node_data)
+
+    def create_branch_element(node_identifiers):
+        return create_element_from_node_identifiers(mesh, coordinates_field, node_identifiers)
+
+    return create_branch_node, create_branch_element
+
+
+def _virtual_branch_creators(node_identifiers, element_identifiers):
+    """
+    Create functions that only allocate identifiers for the branch nodes and elements,
+    the identifiers are the same as the ones Zinc would assign when creating them.
+    """
+    node_identifier_allocator = _allocate_identifiers(node_identifiers)
+    element_identifier_allocator = _allocate_identifiers(element_identifiers)
+
+    def create_branch_node(coordinates):
+        return next(node_identifier_allocator)
+
+    def create_branch_element(node_identifiers):
+        return next(element_identifier_allocator)
+
+    return create_branch_node, create_branch_element
+
+
+def _allocate_identifiers(used_identifiers):
+    """
+    Yield the unused identifiers in increasing order starting from 1.
+    """
+    identifier = 1
+    while True:
+        if identifier not in used_identifiers:
+            yield identifier
+        identifier += 1
+
+
+def _extend_node_table(node_table, node_coordinates):
+    """
+    Add rows to the node table for nodes that only define coordinates.
+    """
+    if not node_coordinates:
+        return node_table
+
+    node_count = len(node_coordinates)
+    points = np.empty((node_count, 4))
+    points[:, :3] = node_coordinates
+    points[:, 3] = 1.0
+    return {
+        'points': np.concatenate((node_table['points'], points)),
+        'colours': np.concatenate((node_table['colours'], np.ones((node_count, 3)))),
+        'resolutions': np.concatenate((node_table['resolutions'], np.full(node_count, np.nan))),
+    }
 
 
 def _print_check_on_field_names(available_fields):  # pragma: no cover
@@ -1,4 +1,4 @@
 
-return_codes = ['SUCCESS', 'MISSING_INPUT_FILE', 'FAILED_TO_READ_EXF']
+return_codes = ['SUCCESS', 'MISSING_INPUT_FILE', 'FAILED_TO_READ_EXF', 'FAILED_TO_CONVERT', 'DUPLICATE_OUTPUT_FILE']
 
 globals().update({code: index for index, code in enumerate(return_codes)})
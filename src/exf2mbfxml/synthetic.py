@@ -0,0 +1,274 @@
+"""
+Write synthetic EXF files of large morphologies for measuring how the conversion scales.
+
+The files use the field conventions of the converter: nodes with coordinates, radius and
+rgb fields on a 1D mesh, annotation groups of nodes and elements, and marker datapoints
+with coordinates, marker_name, radius and rgb fields in a group named marker.
+"""
+import argparse
+import sys
+
+import numpy as np
+
+_NODE_VALUES = 7
+_DEFAULT_CONTOUR_SIZE = 8
+_DEFAULT_VESSEL_SIZE = 4
+_MARKER_NAMES = ['ChAT', 'nNos', 'TH', 'Marker 1', 'Marker 2']
+_BLOCK_SIZE = 100000
+
+
+def write_synthetic_exf(file_name, node_count=1000, tree_count=1, branching_factor=2, tree_depth=4,
+                        contour_count=0, vessel_count=0, three_node_branches=False, group_count=0,
+                        marker_count=0, contour_size=_DEFAULT_CONTOUR_SIZE, vessel_size=_DEFAULT_VESSEL_SIZE, seed=0):
+    """
+    Write a synthetic EXF file and return a dictionary of the counts of what was written.
+
+    The nodes left after the contours and vessels are shared evenly between the branches of
+    the trees, so the number of nodes written is close to, but not always exactly, node_count.
+
+    :param file_name: Location of the EXF file to write.
+    :param node_count: Approximate total number of nodes of the 1D mesh.
+    :param tree_count: Number of trees.
+    :param branching_factor: Number of child branches at the end of each branch of a tree.
+    :param tree_depth: Number of levels of child branches below the root branch of a tree.
+    :param contour_count: Number of closed contours of contour_size nodes each.
+    :param vessel_count: Number of vessels, each made of two parallel chains of vessel_size nodes joining into a tail.
+    :param three_node_branches: If True, child branches start part way along the last element of their
+                                parent branch through a 3 node element, otherwise at the end of the parent branch.
+    :param group_count: Number of annotation groups, each holding the nodes and elements of one tree branch.
+    :param marker_count: Number of marker datapoints.
+    :param seed: Seed of the random coordinates, radii and colours.
+    """
+    rng = np.random.default_rng(seed)
+    mesh = {'coordinates': [], 'radii': [], 'colours': [], 'elements': [], 'branch_elements': [], 'branches': []}
+
+    segment_count = tree_count * sum(branching_factor ** depth for depth in range(tree_depth + 1))
+    tree_node_count = node_count - contour_count * contour_size - vessel_count * (3 * vessel_size + 2)
+    branch_size = max(2, tree_node_count // segment_count) if segment_count else 0
+    for _ in range(tree_count):
+        _add_tree(mesh, rng, branch_size, branching_factor, tree_depth, three_node_branches)
+    for _ in range(contour_count):
+        _add_contour(mesh, rng, contour_size)
+    for _ in range(vessel_count):
+        _add_vessel(mesh, rng, vessel_size)
+
+    coordinates = np.array(mesh['coordinates']).reshape(-1, 3)
+    radii = np.array(mesh['radii'])
+    colours = np.array(mesh['colours']).reshape(-1, 3)
+    branches = mesh['branches']
+    groups = [branches[index * len(branches) // group_count] for index in range(group_count)] if branches else []
+    markers = _create_markers(rng, marker_count, coordinates)
+
+    with open(file_name, 'w') as f:
+        f.write('EX Version: 3\nRegion: /\n!#nodeset nodes\n')
+        f.write(_node_template('node1', [('coordinates', 'coordinate', 3), ('radius', 'field', 1), ('rgb', 'field', 3)]))
+        _write_blocks(f, 'Node: %d\n' + ' % .15e\n' * _NODE_VALUES,
+                      np.column_stack([np.arange(1, len(radii) + 1), coordinates, radii, colours]), _NODE_VALUES + 1)
+
+        f.write('!#mesh mesh1d, dimension=1, nodeset=nodes\n')
+        elements = np.array(mesh['elements'], dtype=np.int64).reshape(-1, 2)
+        if len(elements):
+            f.write(_element_template('element1', 2, ['coordinates', 'radius', 'rgb'], [3, 1, 3]))
+            _write_blocks(f, 'Element: %d\n Nodes:\n %d %d\n', np.column_stack([np.arange(1, len(elements) + 1), elements]), 3)
+
+        branch_elements = mesh['branch_elements']
+        if branch_elements:
+            f.write(_element_template('element2', 3, ['coordinates'], [3]))
+            rows = [(len(elements) + index + 1, first, second, third, 1.0 - xi, xi) for index, (first, second, third, xi) in enumerate(branch_elements)]
+            f.write(''.join('Element: %d\n Nodes:\n %d %d %d\n Scale factors:\n % .15e % .15e\n' % row for row in rows))
+
+        if markers is not None:
+            f.write('!#nodeset datapoints\n')
+            f.write(_node_template('node2', [('coordinates', 'coordinate', 3), ('marker_name', 'string', 1), ('radius', 'field', 1), ('rgb', 'field', 3)]))
+            f.write(''.join(_format_marker(index + 1, marker) for index, marker in enumerate(zip(*markers))))
+
+        for index, (node_ids, element_ids) in enumerate(groups):
+            f.write(f'Group name: group {index + 1}\n!#nodeset nodes\nNode group:\n{_ranges(node_ids)}\n')
+            f.write(f'!#mesh mesh1d, dimension=1, nodeset=nodes\nElement group:\n{_ranges(element_ids)}\n')
+
+        if markers is not None:
+            f.write(f'Group name: marker\n!#nodeset datapoints\nNode group:\n1..{marker_count}\n')
+
+    return {'nodes': len(radii), 'elements': len(elements) + len(branch_elements), 'branch_elements': len(branch_elements),
+            'trees': tree_count, 'contours': contour_count, 'vessels': vessel_count, 'groups': len(groups), 'markers': marker_count}
+
+
+def _add_nodes(mesh, coordinates, radii, colour):
+    first_node = len(mesh['radii']) + 1
+    mesh['coordinates'].extend(coordinates.ravel().tolist())
+    mesh['radii'].extend(radii.tolist())
+    mesh['colours'].extend(list(colour) * len(radii))
+    return list(range(first_node, first_node + len(radii)))
+
+
+def _add_chain(mesh, node_ids, start_node=None):
+    """
+    Add the elements joining the nodes in turn, starting from start_node if given. Return the element identifiers.
+    """
+    chain = node_ids if start_node is None else [start_node] + node_ids
+    first_element = len(mesh['elements']) // 2 + 1
+    for first, second in zip(chain[:-1], chain[1:]):
+        mesh['elements'].extend((first, second))
+
+    return list(range(first_element, len(mesh['elements']) // 2 + 1))
+
+
+def _random_direction(rng, direction=None):
+    vector = rng.normal(size=3) if direction is None else direction + rng.normal(scale=0.6, size=3)
+    return vector / np.linalg.norm(vector)
+
+
+def _add_tree(mesh, rng, branch_size, branching_factor, tree_depth, three_node_branches):
+    colour = rng.random(3)
+    # Each pending branch is (depth, start coordinates, direction, start node, parent nodes, xi).
+    pending = [(0, rng.uniform(-1000.0, 1000.0, 3), _random_direction(rng), None, None, None)]
+    while pending:
+        depth, start, direction, start_node, parent_nodes, xi = pending.pop()
+        steps = np.arange(1, branch_size + 1)[:, np.newaxis]
+        coordinates = start + direction * steps * 10.0 + rng.normal(scale=1.0, size=(branch_size, 3))
+        radii = np.maximum(0.1, 2.0 - 0.3 * depth + rng.normal(scale=0.05, size=branch_size))
+        node_ids = _add_nodes(mesh, coordinates, radii, colour)
+        element_ids = _add_chain(mesh, node_ids, start_node)
+        if parent_nodes is not None:
+            mesh['branch_elements'].append((parent_nodes[0], parent_nodes[1], node_ids[0], xi))
+        mesh['branches'].append((node_ids, element_ids))
+
+        if depth < tree_depth:
+            for child in range(branching_factor - 1, -1, -1):
+                child_direction = _random_direction(rng, direction)
+                if three_node_branches:
+                    child_xi = (child + 1) / (branching_factor + 1)
+                    child_start = (1.0 - child_xi) * coordinates[-2] + child_xi * coordinates[-1]
+                    pending.append((depth + 1, child_start, child_direction, None, node_ids[-2:], child_xi))
+                else:
+                    pending.append((depth + 1, coordinates[-1], child_direction, node_ids[-1], None, None))
+
+
+def _add_contour(mesh, rng, contour_size):
+    centre = rng.uniform(-1000.0, 1000.0, 3)
+    angles = np.linspace(0.0, 2.0 * np.pi, contour_size, endpoint=False)
+    coordinates = centre + 50.0 * np.column_stack([np.cos(angles), np.sin(angles), np.zeros(contour_size)])
+    node_ids = _add_nodes(mesh, coordinates, np.full(contour_size, 0.5), rng.random(3))
+    _add_chain(mesh, node_ids + node_ids[:1])
+
+
+def _add_vessel(mesh, rng, vessel_size):
+    colour = rng.random(3)
+    origin = rng.uniform(-1000.0, 1000.0, 3)
+    steps = np.arange(1, vessel_size + 1)[:, np.newaxis]
+    split_node, = _add_nodes(mesh, origin[np.newaxis], np.array([1.5]), colour)
+    merge_offset = np.array([10.0 * (vessel_size + 1), 0.0, 0.0])
+    upper = _add_nodes(mesh, origin + steps * np.array([10.0, 5.0, 0.0]) * [1.0, 1.0 / vessel_size, 0.0], np.full(vessel_size, 1.0), colour)
+    lower = _add_nodes(mesh, origin + steps * np.array([10.0, -5.0, 0.0]) * [1.0, 1.0 / vessel_size, 0.0], np.full(vessel_size, 1.0), colour)
+    merge_node, = _add_nodes(mesh, (origin + merge_offset)[np.newaxis], np.array([1.5]), colour)
+    tail = _add_nodes(mesh, origin + merge_offset + steps * np.array([10.0, 0.0, 0.0]), np.full(vessel_size, 1.5), colour)
+    _add_chain(mesh, upper + [merge_node], split_node)
+    _add_chain(mesh, lower + [merge_node], split_node)
+    _add_chain(mesh, tail, merge_node)
+
+
+def _create_markers(rng, marker_count, coordinates):
+    if marker_count == 0:
+        return None
+
+    low, high = (coordinates.min(axis=0), coordinates.max(axis=0)) if len(coordinates) else (np.zeros(3), np.ones(3))
+    names = [_MARKER_NAMES[index % len(_MARKER_NAMES)] for index in range(marker_count)]
+    return rng.uniform(low, high, (marker_count, 3)), names, rng.uniform(0.5, 3.0, marker_count), rng.random((marker_count, 3))
+
+
+def _format_marker(identifier, marker):
+    coordinates, name, radius, colour = marker
+    return (f'Node: {identifier}\n' + ''.join(' % .15e\n' % value for value in coordinates) + f' {_quote(name)}\n' +
+            ' % .15e\n' % radius + ''.join(' % .15e\n' % value for value in colour))
+
+
+def _quote(name):
+    return f'"{name}"' if ' ' in name else name
+
+
+def _write_blocks(f, row_format, table, columns):
+    """
+    Write the rows of the table with the row format, formatting a block of rows at a time.
+    """
+    values = table.tolist()
+    for start in range(0, len(values), _BLOCK_SIZE):
+        block = values[start:start + _BLOCK_SIZE]
+        f.write((row_format * len(block)) % tuple(value for row in block for value in row[:columns]))
+
+
+def _node_template(name, fields):
+    lines = [f'Define node template: {name}', 'Shape. Dimension=0', f'#Fields={len(fields)}']
+    for index, (field_name, field_type, components) in enumerate(fields):
+        if field_type == 'string':
+            lines.append(f'{index + 1}) {field_name}, field, string, #Components={components}')
+        else:
+            lines.append(f'{index + 1}) {field_name}, {field_type}, rectangular cartesian, real, #Components={components}')
+        labels = ['x', 'y', 'z'] if field_type == 'coordinate' else [str(component + 1) for component in range(components)]
+        lines.extend(f' {label}. #Values=1 (value)' for label in labels)
+
+    lines.append(f'Node template: {name}')
+    return '\n'.join(lines) + '\n'
+
+
+def _element_template(name, node_count, field_names, components):
+    lines = [f'Define element template: {name}', 'Shape. Dimension=1, line']
+    if node_count == 3:
+        lines.extend(['#Scale factor sets=1', '  scaling1, #Scale factors=2, identifiers="element_general(0,0)"'])
+    else:
+        lines.append('#Scale factor sets=0')
+    lines.extend([f'#Nodes={node_count}', f'#Fields={len(field_names)}'])
+    for index, (field_name, component_count) in enumerate(zip(field_names, components)):
+        field_type = 'coordinate' if field_name == 'coordinates' else 'field'
+        lines.append(f'{index + 1}) {field_name}, {field_type}, rectangular cartesian, real, #Components={component_count}')
+        labels = ['x', 'y', 'z'] if field_type == 'coordinate' else [str(component + 1) for component in range(component_count)]
+        for label in labels:
+            if node_count == 3:
+                lines.extend([f' {label}. l.Lagrange, no modify, standard node based. scale factor set=scaling1', '  #Nodes=3',
+                              '  1+2. #Values=1', '   Value labels: value+value', '   Scale factor indices: 1+2',
+                              '  3. #Values=1', '   Value labels: value', '   Scale factor indices: 0'])
+            else:
+                lines.extend([f' {label}. l.Lagrange, no modify, standard node based.', '  #Nodes=2',
+                              '  1. #Values=1', '   Value labels: value', '  2. #Values=1', '   Value labels: value'])
+
+    lines.append(f'Element template: {name}')
+    return '\n'.join(lines) + '\n'
+
+
+def _ranges(identifiers):
+    """
+    Format the sorted identifiers as EXF ranges, for example 1..4,6.
+    """
+    ranges = []
+    start = previous = identifiers[0]
+    for identifier in identifiers[1:]:
+        if identifier != previous + 1:
+            ranges.append(f'{start}..{previous}' if previous > start else f'{start}')
+            start = identifier
+        previous = identifier
+    ranges.append(f'{start}..{previous}' if previous > start else f'{start}')
+    return ','.join(ranges)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic EXF file of a large morphology.")
+    parser.add_argument("output_exf", help="Location of the EXF file to write.")
+    parser.add_argument("--nodes", type=int, default=1000, help="Approximate number of nodes [defaults to 1000].")
+    parser.add_argument("--trees", type=int, default=1, help="Number of trees [defaults to 1].")
+    parser.add_argument("--branching-factor", type=int, default=2, help="Child branches at the end of each branch [defaults to 2].")
+    parser.add_argument("--depth", type=int, default=4, help="Levels of child branches of each tree [defaults to 4].")
+    parser.add_argument("--contours", type=int, default=0, help="Number of closed contours.")
+    parser.add_argument("--vessels", type=int, default=0, help="Number of vessels.")
+    parser.add_argument("--three-node-branches", action="store_true", help="Start child branches with 3 node elements.")
+    parser.add_argument("--groups", type=int, default=0, help="Number of annotation groups.")
+    parser.add_argument("--markers", type=int, default=0, help="Number of markers.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random values.")
+    args = parser.parse_args()
+
+    counts = write_synthetic_exf(args.output_exf, args.nodes, args.trees, args.branching_factor, args.depth, args.contours,
+                                 args.vessels, args.three_node_branches, args.groups, args.markers, seed=args.seed)
+    print(', '.join(f'{key}={value}' for key, value in counts.items()))
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
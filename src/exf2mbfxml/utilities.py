@@ -1,5 +1,9 @@
 import xml.etree.ElementTree as ET
 
+from collections import defaultdict
+
+import numpy as np
+
 from cmlibs.utils.zinc.field import field_is_managed_coordinates
 
 
@@ -18,6 +22,32 @@ def rgb_to_hex(rgb_value):
     return '#{:02x}{:02x}{:02x}'.format(*scaled_values).upper()
 
 
+def project_points_onto_segments(points, segment_starts, segment_ends):
+    """
+    Project each point onto the straight line segment defined by the matching rows
+    of the segment start and end arrays. The projection is clamped to the segment,
+    giving the nearest location on a linear Lagrange element.
+
+    :param points: Array like of shape (N, 3) of points to project.
+    :param segment_starts: Array like of shape (N, 3) of segment start coordinates.
+    :param segment_ends: Array like of shape (N, 3) of segment end coordinates.
+    :return: Tuple of the xi location of each projection in the range [0, 1] and the projected coordinates.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    segment_starts = np.asarray(segment_starts, dtype=float).reshape(-1, 3)
+    segment_ends = np.asarray(segment_ends, dtype=float).reshape(-1, 3)
+
+    direction = segment_ends - segment_starts
+    length_squared = np.einsum('ij,ij->i', direction, direction)
+    offset = np.einsum('ij,ij->i', points - segment_starts, direction)
+    xi = np.divide(offset, length_squared, out=np.zeros_like(offset), where=length_squared > 0.0)
+    np.clip(xi, 0.0, 1.0, out=xi)
+
+    xi_column = xi[:, np.newaxis]
+    projected = (1.0 - xi_column) * segment_starts + xi_column * segment_ends
+    return xi, projected
+
+
 def is_sequence_nested(data, sequence):
     if not isinstance(data, list):
         return False
@@ -68,6 +98,207 @@ def nest_sequence(data, sequence):
     return result
 
 
+class _NestingLevel(object):
+    """
+    A list level of a nested list, with the count of each integer held directly in the level.
+    """
+    __slots__ = ('items', 'parent', 'counts')
+
+    def __init__(self, items, parent):
+        self.items = items
+        self.parent = parent
+        self.counts = {}
+
+
+class _NestingIndex(object):
+    """
+    Nested list levels together with a lookup from each integer to the levels holding it.
+    """
+
+    def __init__(self, data):
+        self.node_levels = defaultdict(set)
+        self.root = self._build(data, None)
+
+    def _build(self, data, parent):
+        level = _NestingLevel([], parent)
+        for item in data:
+            level.items.append(self._build(item, level) if isinstance(item, list) else item)
+        self._add_items(level, level.items)
+        return level
+
+    def _add_items(self, level, items):
+        counts = level.counts
+        for item in items:
+            if isinstance(item, _NestingLevel):
+                item.parent = level
+            else:
+                counts[item] = counts.get(item, 0) + 1
+                self.node_levels[item].add(level)
+
+    def _remove_items(self, level, items):
+        counts = level.counts
+        for item in items:
+            if not isinstance(item, _NestingLevel):
+                counts[item] -= 1
+                if counts[item] == 0:
+                    del counts[item]
+                    self.node_levels[item].discard(level)
+
+    def _new_level(self, items, parent):
+        level = _NestingLevel(items, parent)
+        self._add_items(level, items)
+        return level
+
+    def candidate_levels(self, sequence):
+        """
+        Return the levels directly holding every integer of the sequence, outer levels first.
+        """
+        node_levels = self.node_levels
+        anchor_levels = min((node_levels.get(node, ()) for node in sequence), key=len)
+        candidates = [level for level in anchor_levels if all(node in level.counts for node in sequence)]
+        if len(candidates) > 1:
+            candidates.sort(key=_level_depth)
+        return candidates
+
+    def nest(self, level, sequence, blocked):
+        """
+        Apply nest_sequence to the items of a single level, the nested lists of the level are not visited.
+        Levels that nest_sequence would not visit after this level is processed are added to blocked.
+        """
+        items = level.items
+        leading = []
+        for item in items:
+            if not isinstance(item, int):
+                break
+            leading.append(item)
+        if set(leading) == sequence:
+            blocked.add(level)
+            return
+
+        i = _find_matching_window(items, sequence)
+        if i is None:
+            return
+
+        sequence_length = len(sequence)
+        i_end = i + sequence_length
+        window = items[i:i_end]
+        rest = items[i_end:]
+        self._remove_items(level, items[i:])
+        if i == 0:
+            new_level = self._new_level(rest, level)
+            level.items = [*window, new_level]
+            self._add_items(level, window)
+        elif not rest:
+            new_level = self._new_level(window, level)
+            level.items = [*items[:i], new_level]
+        elif len(rest) == 1 and isinstance(rest[0], _NestingLevel):
+            new_level = self._new_level([*window, *rest], level)
+            level.items = [*items[:i], new_level]
+        else:
+            new_level = self._new_level([*window, self._new_level(rest, None)], level)
+            level.items = [*items[:i], new_level]
+
+        blocked.add(new_level)
+
+    def to_list(self):
+        return _level_to_list(self.root)
+
+
+def _level_depth(level):
+    depth = 0
+    while level.parent is not None:
+        level = level.parent
+        depth += 1
+    return depth
+
+
+def _is_blocked(level, blocked):
+    level = level.parent
+    while level is not None:
+        if level in blocked:
+            return True
+        level = level.parent
+    return False
+
+
+def _find_matching_window(items, sequence):
+    """
+    Find the first index where the window of len(sequence) items holds exactly the integers of the sequence.
+    """
+    sequence_length = len(sequence)
+    window_counts = {}
+    unmatched = 0
+    for index, item in enumerate(items):
+        if isinstance(item, _NestingLevel) or item not in sequence:
+            unmatched += 1
+        else:
+            window_counts[item] = window_counts.get(item, 0) + 1
+
+        start = index - sequence_length + 1
+        if start > 0:
+            removed = items[start - 1]
+            if isinstance(removed, _NestingLevel) or removed not in sequence:
+                unmatched -= 1
+            else:
+                window_counts[removed] -= 1
+                if window_counts[removed] == 0:
+                    del window_counts[removed]
+
+        if start >= 0 and unmatched == 0 and len(window_counts) == sequence_length:
+            return start
+
+    return None
+
+
+def _level_to_list(level):
+    result = []
+    stack = [(level, result)]
+    while stack:
+        current_level, current_list = stack.pop()
+        for item in current_level.items:
+            if isinstance(item, _NestingLevel):
+                child_list = []
+                current_list.append(child_list)
+                stack.append((item, child_list))
+            else:
+                current_list.append(item)
+    return result
+
+
+def nest_sequences(data, sequences):
+    """
+    Nest the data by each of the sequences in turn, giving the same result as calling
+    nest_sequence for each sequence in order. Each sequence is only applied to the levels
+    of the nested data that hold all of its integers, found through an integer to level lookup,
+    and the window matching uses running counts, so the cost does not grow with the
+    number of sequences times the size of the data.
+    """
+    if not isinstance(data, list):
+        return []
+
+    sequences = list(sequences)
+    nesting_index = _NestingIndex(data)
+    for index, sequence in enumerate(sequences):
+        sequence_set = set(sequence)
+        if not sequence_set or len(sequence_set) != len(sequence):
+            # Empty sequences and sequences with repeated integers are left to nest_sequence.
+            return _nest_sequences_in_turn(nesting_index.to_list(), sequences[index:])
+
+        sequence = sequence_set
+        blocked = set()
+        for level in nesting_index.candidate_levels(sequence):
+            if not _is_blocked(level, blocked):
+                nesting_index.nest(level, sequence, blocked)
+
+    return nesting_index.to_list()
+
+
+def _nest_sequences_in_turn(data, sequences):
+    for sequence in sequences:
+        data = nest_sequence(data, sequence)
+    return data
+
+
 def nest_multiple_sequences(data, sequences):
     for seq in sequences:
         if not is_sequence_nested(data, seq):
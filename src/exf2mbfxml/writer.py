@@ -1,9 +1,32 @@
+import contextlib
+import copy
+import gzip
+import io
+import lzma
+import re
 import xml.etree.ElementTree as ET
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
 from exf2mbfxml import __version__ as package_version
-from exf2mbfxml.utilities import is_valid_xml
+from exf2mbfxml.profiling import stage
 
 
 _DEFAULT_COLOUR = '#FFFFFF'
+_ENCODING = 'ISO-8859-1'
+_INDENT = '  '
+_DEFAULT_PRECISION = 2
+_POINTS_PLACEHOLDER = re.compile(r'<!--points (\d+)-->')
+_FRAGMENT_CHUNK_SIZE = 16
+_COMPRESSORS = {
+    'gzip': lambda output: gzip.GzipFile(fileobj=output, mode='wb', mtime=0),
+    'xz': lambda output: lzma.LZMAFile(output, 'wb'),
+}
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'xz': '.xz'}
 
 
 def _is_trace_association(label):
@@ -19,11 +42,49 @@ def _is_set_property(label):
     return False
 
 
-def _is_type_of_property(label):
-    return _is_set_property(label) or _is_trace_association(label) or is_valid_xml(label)
+def _classify_label(label):
+    """
+    Classify the label as (property name, is type of property, XML element), the property name
+    is None for a label that is valid XML, which is written as the parsed XML element.
+    """
+    if _is_trace_association(label):
+        return 'TraceAssociation', True, None
+
+    try:
+        fragment = ET.fromstring(label)
+    except ET.ParseError:
+        return 'Set', _is_set_property(label), None
+
+    return None, True, fragment
+
+
+class _LabelKinds(object):
+    """
+    Classification of the labels of one conversion, each distinct label is classified and
+    parsed once. The parsed XML elements are copied for each use.
+    """
+
+    def __init__(self):
+        self._kinds = {}
+
+    def classify(self, label):
+        kind = self._kinds.get(label)
+        if kind is None:
+            kind = self._kinds[label] = _classify_label(label)
+
+        return kind
+
+    def is_type_of_property(self, label):
+        return self.classify(label)[1]
 
+    def fragment(self, label):
+        return self.classify(label)[2]
 
-def _write_contour(contour, parent_element):
+    def copy_fragment(self, label):
+        return copy.deepcopy(self.classify(label)[2])
+
+
+def _write_contour(contour, parent_element, write_points, label_kinds):
     points = contour.get("points", [])
     metadata = contour.get("metadata", [])
     if not points:
@@ -62,52 +123,98 @@ def _write_contour(contour, parent_element):
     if resolution is not None:
         ET.SubElement(contour_element, "resolution").text = str(resolution)
 
-    _define_properties(contour_element, labels)
+    _define_properties(contour_element, labels, label_kinds)
 
     # Add points
-    for point in points:
-        _write_point(contour_element, point)
+    write_points(contour_element, points)
 
 
-def _define_properties(parent_element, labels):
+def _define_properties(parent_element, labels, label_kinds):
     """
     Only useful for setting single string properties.
     Will differentiate between trace association and non-trace associations
     using a very basic heuristic.
     """
     for label in labels:
-        tag_name = 'Set'
-        if _is_trace_association(label):
-            tag_name = 'TraceAssociation'
-        elif is_valid_xml(label):
-            tag_name = None
-            child = ET.fromstring(label)
-            parent_element.append(child)
-
-        if tag_name is not None:
+        tag_name = label_kinds.classify(label)[0]
+        if tag_name is None:
+            parent_element.append(label_kinds.copy_fragment(label))
+        else:
             set_property_element = ET.SubElement(parent_element, 'property', name=tag_name)
             ET.SubElement(set_property_element, 's').text = label
 
 
-def _write_point(parent_element, point):
-    ET.SubElement(parent_element, "point", x=f'{point[0]:.2f}', y=f'{point[1]:.2f}', z=f'{point[2]:.2f}', d=f'{point[3]:.2f}')
+def _write_point(parent_element, point, precision=_DEFAULT_PRECISION):
+    ET.SubElement(parent_element, "point", x=f'{point[0]:.{precision}f}', y=f'{point[1]:.{precision}f}',
+                  z=f'{point[2]:.{precision}f}', d=f'{point[3]:.{precision}f}')
+
+
+def _write_points(parent_element, points, precision=_DEFAULT_PRECISION):
+    for point in points:
+        _write_point(parent_element, point, precision)
+
+
+def _format_points(points, precision, separator):
+    """
+    Format the points as point elements joined by the separator, formatting all the
+    coordinates of the points with a single string formatting operation.
+    """
+    values = np.asarray(points, dtype=float)[:, :4]
+    point_format = f'<point x="%.{precision}f" y="%.{precision}f" z="%.{precision}f" d="%.{precision}f" />'
+    return separator.join([point_format] * len(values)) % tuple(values.ravel().tolist())
+
+
+class _PointBlocks(object):
+    """
+    Point writer for the streaming output, writing a placeholder for each run of points
+    that is replaced by the formatted points once the element has been serialized.
+    """
 
+    def __init__(self, precision):
+        self._precision = precision
+        self._blocks = []
 
-def _write_branch(parent_element, tag, attributes, points, path, indexed_labels):
+    def __call__(self, parent_element, points):
+        if len(points):
+            parent_element.append(ET.Comment(f'points {len(self._blocks)}'))
+            self._blocks.append((parent_element, points))
+
+    def substitute(self, text):
+        """
+        Replace the placeholders in the serialized text, the points in a run are separated by
+        the indentation of their parent element.
+        """
+        if not self._blocks:
+            return text
+
+        blocks = self._blocks
+        self._blocks = []
+
+        def format_block(match):
+            parent_element, points = blocks[int(match.group(1))]
+            return _format_points(points, self._precision, parent_element.text)
+
+        return _POINTS_PLACEHOLDER.sub(format_block, text)
+
+
+def _write_branch(parent_element, tag, attributes, points, path, indexed_labels, write_points, label_kinds):
     branch_element = ET.SubElement(parent_element, tag, attrib=attributes)
 
     current_label_path = tuple(path + [0])
-    _define_properties(branch_element, indexed_labels.get(current_label_path, []))
+    _define_properties(branch_element, indexed_labels.get(current_label_path, []), label_kinds)
 
+    branch_points = []
     for i, point in enumerate(points):
         current_path = path + [i]
 
         if isinstance(point[0], float):
-            _write_point(branch_element, point)
+            branch_points.append(point)
         else:
+            write_points(branch_element, branch_points)
+            branch_points = []
             child_label_path = tuple(current_path + [0])
             branch_labels = indexed_labels.get(child_label_path, [])
-            branch_class = _extract_branch_class(branch_labels)
+            branch_class = _extract_branch_class(branch_labels, label_kinds)
 
             if branch_class:
                 indexed_labels[child_label_path].remove(branch_class)
@@ -115,18 +222,20 @@ def _write_branch(parent_element, tag, attributes, points, path, indexed_labels)
             else:
                 branch_attributes = {}
 
-            _write_branch(branch_element, "branch", branch_attributes, point, current_path, indexed_labels)
+            _write_branch(branch_element, "branch", branch_attributes, point, current_path, indexed_labels, write_points, label_kinds)
 
+    write_points(branch_element, branch_points)
 
-def _extract_branch_class(labels):
+
+def _extract_branch_class(labels, label_kinds):
     """Extract the first label that is not a trace association or valid XML."""
     for label in labels:
-        if not _is_type_of_property(label):
+        if not label_kinds.is_type_of_property(label):
             return label
     return None
 
 
-def _write_tree(tree, parent_element):
+def _write_tree(tree, parent_element, write_points, label_kinds):
     points = tree.get("points", [])
     metadata = tree.get("metadata", [])
     if not points:
@@ -144,15 +253,15 @@ def _write_tree(tree, parent_element):
         for item in global_labels:
             if item in TREE_TYPES:
                 attributes['type'] = item
-            elif _is_type_of_property(item):
+            elif label_kinds.is_type_of_property(item):
                 indexed_labels[(0,)].append(item)
             else:
                 attributes['rootclass'] = item
 
-    _write_branch(parent_element, "tree", attributes, points, [], indexed_labels)
+    _write_branch(parent_element, "tree", attributes, points, [], indexed_labels, write_points, label_kinds)
 
 
-def _write_vessel(vessel, parent_element):
+def _write_vessel(vessel, parent_element, write_points, label_kinds):
     points = vessel.get("points", [])
     metadata = vessel.get("metadata", [])
     if not points:
@@ -181,7 +290,7 @@ def _write_vessel(vessel, parent_element):
         point_tuple = tuple(pt[:4])
         if point_tuple not in node_id_map:
             node = ET.SubElement(nodes_element, "node", id=str(node_id_counter))
-            _write_point(node, pt)
+            write_points(node, [pt])
             # ET.SubElement(node, "point", x=str(pt[0]), y=str(pt[1]), z=str(pt[2]), d=str(pt[3]))
             node_id_map[point_tuple] = node_id_counter
             node_id_counter += 1
@@ -189,9 +298,7 @@ def _write_vessel(vessel, parent_element):
 
     for edge in points:
         edge_element = ET.SubElement(edges_element, "edge", id=str(edge_id_counter))
-        for point in edge:
-            _write_point(edge_element, point)
-            # ET.SubElement(edge_element, "point", x=str(point[0]), y=str(point[1]), z=str(point[2]), d=str(point[3]))
+        write_points(edge_element, edge)
 
         source_node_id = add_node(edge[0])
         target_node_id = add_node(edge[-1])
@@ -201,7 +308,7 @@ def _write_vessel(vessel, parent_element):
         edge_id_counter += 1
 
 
-def _write_marker(marker, root):
+def _write_marker(marker, root, write_points, label_kinds):
     point = marker.get("point", [])
     metadata = marker.get("metadata", [])
     if not point:
@@ -211,27 +318,251 @@ def _write_marker(marker, root):
     attributes = {k: v for k, v in attributes.items() if v is not None}
 
     marker_element = ET.SubElement(root, 'marker', attrib=attributes)
-    _write_point(marker_element, point)
+    write_points(marker_element, [point])
 
 
-def write_mbfxml(output_mbf, data, options=None):
-    # Create the root element
-    root = ET.Element("mbf", version="4.0", xmlns="http://www.mbfbioscience.com/2007/neurolucida",
+def _create_root():
+    return ET.Element("mbf", version="4.0", xmlns="http://www.mbfbioscience.com/2007/neurolucida",
                       appname="Exf2MBFXML", appversion=package_version)
 
-    for marker in data.get('markers', []):
-        _write_marker(marker, root)
 
-    for contour in data.get('contours', []):
-        _write_contour(contour, root)
+_OBJECT_WRITERS = {'markers': _write_marker, 'contours': _write_contour, 'trees': _write_tree, 'vessels': _write_vessel}
+
+
+def _item_elements(items, write_points, label_kinds):
+    """
+    Create the element of each item in turn from the category and the item.
+    """
+    for category, item in items:
+        parent_element = ET.Element("mbf")
+        _OBJECT_WRITERS[category](item, parent_element, write_points, label_kinds)
+        yield from parent_element
+
+
+def _data_items(data):
+    return ((category, item) for category in _OBJECT_WRITERS for item in data.get(category, []))
+
 
-    for tree in data.get('trees', []):
-        _write_tree(tree, root)
+def _is_qualified_label(label, label_kinds):
+    fragment = label_kinds.fragment(label)
+    return fragment is not None and any(element.tag.startswith('{') or any(key.startswith('{') for key in element.attrib)
+                                        for element in fragment.iter())
 
-    for vessel in data.get('vessels', []):
-        _write_vessel(vessel, root)
+
+def _has_qualified_labels(data, label_kinds):
+    """
+    Determine if any XML label of the contours and trees uses namespaces.
+    """
+    for category in ['contours', 'trees']:
+        for item in data.get(category, []):
+            metadata = item.get("metadata", {})
+            labels = list(metadata.get('global', {}).get('labels', []))
+            for indexed_labels in metadata.get('indexed', {}).values():
+                labels.extend(indexed_labels)
+
+            if any(_is_qualified_label(label, label_kinds) for label in labels):
+                return True
+
+    return False
+
+
+def _write_mbfxml_tree(output_mbf, data, precision=_DEFAULT_PRECISION, label_kinds=None):
+    root = _create_root()
+    label_kinds = _LabelKinds() if label_kinds is None else label_kinds
+    for element in _item_elements(_data_items(data), partial(_write_points, precision=precision), label_kinds):
+        root.append(element)
 
     # Create the XML tree and write to a file
     tree = ET.ElementTree(root)
     ET.indent(tree, level=0)
-    tree.write(output_mbf, encoding="ISO-8859-1", xml_declaration=True)
+    tree.write(output_mbf, encoding=_ENCODING, xml_declaration=True)
+
+
+def _element_fragments(elements, point_blocks):
+    for element in elements:
+        ET.indent(element, space=_INDENT, level=1)
+        yield point_blocks.substitute(ET.tostring(element, encoding='unicode'))
+
+
+def _item_fragments(items, precision, label_kinds):
+    """
+    Serialize the element of each item in turn, indented for the first level below the root.
+    """
+    point_blocks = _PointBlocks(precision)
+    return _element_fragments(_item_elements(items, point_blocks, label_kinds), point_blocks)
+
+
+_fragment_precision = None
+_fragment_label_kinds = None
+
+
+def _initialise_fragment_worker(precision):
+    global _fragment_precision, _fragment_label_kinds
+    _fragment_precision = precision
+    _fragment_label_kinds = _LabelKinds()
+
+
+def _item_fragments_task(items):
+    return list(_item_fragments(items, _fragment_precision, _fragment_label_kinds))
+
+
+def _chunks(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _parallel_item_fragments(items, precision, workers):
+    """
+    Serialize the items in chunks in a pool of worker processes, yielding the fragments in item order.
+    At most two chunks per worker are in flight, so the items are consumed as the fragments are written.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initialise_fragment_worker, initargs=(precision,)) as executor:
+        pending = deque()
+        for chunk in _chunks(items, _FRAGMENT_CHUNK_SIZE):
+            pending.append(executor.submit(_item_fragments_task, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _fragments(items, options, label_kinds):
+    options = {} if options is None else options
+    precision = options.get('precision', _DEFAULT_PRECISION)
+    workers = options.get('workers')
+    if workers is None or workers < 2:
+        return _item_fragments(items, precision, label_kinds)
+
+    return _parallel_item_fragments(items, precision, workers)
+
+
+def _stream_mbfxml(output_mbf, fragments):
+    """
+    Write the serialized elements to the MBF XML output one at a time under the root element,
+    giving the same output as indenting and writing the complete element tree.
+    """
+    root = _create_root()
+    root_end_tag = f'</{root.tag}>'
+    with _open_text_output(output_mbf) as output:
+        write = output.write
+        write(f"<?xml version='1.0' encoding='{_ENCODING}'?>\n")
+        empty = True
+        for fragment in fragments:
+            if empty:
+                root.text = '\n' + _INDENT
+                write(ET.tostring(root, encoding='unicode')[:-len(root_end_tag)])
+                empty = False
+            else:
+                write('\n' + _INDENT)
+
+            write(fragment)
+
+        write(ET.tostring(root, encoding='unicode') if empty else '\n' + root_end_tag)
+
+
+@contextlib.contextmanager
+def _open_text_output(output_mbf):
+    """
+    Open the output for writing text encoded as ElementTree.write encodes it. A file name is opened
+    as a text file, a binary file-like object is wrapped and flushed but left open.
+    """
+    if not hasattr(output_mbf, 'write'):
+        with open(output_mbf, 'w', encoding=_ENCODING, errors='xmlcharrefreplace') as output:
+            yield output
+        return
+
+    if not isinstance(output_mbf, io.BufferedIOBase):
+        output_mbf = io.BufferedWriter(output_mbf if isinstance(output_mbf, io.RawIOBase) else _WriteTarget(output_mbf.write))
+        buffered = True
+    else:
+        buffered = False
+
+    output = io.TextIOWrapper(output_mbf, encoding=_ENCODING, errors='xmlcharrefreplace', newline='\n')
+    try:
+        yield output
+    finally:
+        output.flush()
+        output.detach()
+        if buffered:
+            output_mbf.detach()
+
+
+class _WriteTarget(io.RawIOBase):
+    """
+    File object for the compressors writing to any object with a write method.
+    """
+
+    def __init__(self, write):
+        self._write = write
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self._write(data)
+
+
+@contextlib.contextmanager
+def _open_output(output_mbf, compression):
+    """
+    Open the output for writing with the given compression, a file name is opened as a file and
+    a binary file-like object is written to without closing it.
+    """
+    if compression is None:
+        yield output_mbf
+        return
+
+    if compression not in _COMPRESSORS:
+        raise ValueError(f'Unknown compression "{compression}", expected one of {", ".join(_COMPRESSORS)}.')
+
+    with contextlib.ExitStack() as stack:
+        if not hasattr(output_mbf, 'write'):
+            output_mbf = stack.enter_context(open(output_mbf, 'wb'))
+        elif not isinstance(output_mbf, io.IOBase):
+            output_mbf = _WriteTarget(output_mbf.write)
+
+        yield stack.enter_context(_COMPRESSORS[compression](output_mbf))
+
+
+def write_mbfxml(output_mbf, data, options=None):
+    """
+    Write the markers, contours, trees and vessels to the MBF XML output, a file name or
+    a binary file-like object such as sys.stdout.buffer, a pipe or a socket file.
+
+    Each object is serialized as soon as it is created, so only one object is held in memory
+    as an element tree at a time. Data with XML labels that use namespaces is written from the
+    complete element tree, as the namespace declarations are written on the root element.
+
+    :param options: Dictionary of writer options, 'precision' sets the number of decimal places
+                    of the point coordinates and diameters [defaults to 2], 'workers' sets the number
+                    of worker processes serializing the objects [defaults to the current process] and
+                    'compression' compresses the output with 'gzip' or 'xz' [defaults to no compression].
+    """
+    compression = None if options is None else options.get('compression')
+    label_kinds = _LabelKinds()
+    with stage('write_mbfxml'), _open_output(output_mbf, compression) as output:
+        if _has_qualified_labels(data, label_kinds):
+            precision = _DEFAULT_PRECISION if options is None else options.get('precision', _DEFAULT_PRECISION)
+            _write_mbfxml_tree(output, data, precision, label_kinds)
+        else:
+            _stream_mbfxml(output, _fragments(_data_items(data), options, label_kinds))
+
+
+def write_mbfxml_items(output_mbf, items, options=None):
+    """
+    Write the MBF XML output from an iterator of the category and the item for each marker,
+    contour, tree and vessel, such as the one returned by reader.iterate_exf. Each item is written
+    as soon as it is produced, in the order of the iterator. Namespaces used by XML labels are
+    declared on the element of the item they appear in. The output and options are as for write_mbfxml.
+    """
+    compression = None if options is None else options.get('compression')
+    with stage('write_mbfxml'), _open_output(output_mbf, compression) as output:
+        _stream_mbfxml(output, _fragments(items, options, _LabelKinds()))
@@ -1,28 +1,34 @@
+import numpy as np
+
+from cmlibs.zinc.element import Elementbasis, Elementfieldtemplate
 from cmlibs.zinc.field import Field
+from cmlibs.zinc.node import Node
 from cmlibs.zinc.result import RESULT_OK, RESULT_ERROR_GENERAL
 
-from exf2mbfxml.utilities import rgb_to_hex
 
+def is_linear_lagrange_template(eft):
+    """
+    Determine if the element field template interpolates linearly between the values
+    of exactly two local nodes, without versions, derivatives or scale factors.
+    """
+    if eft.getNumberOfLocalNodes() != 2 or eft.getNumberOfLocalScaleFactors() != 0:
+        return False
 
-def get_point(node, fields):
-    coordinate_field = fields["coordinates"]
-    field_module = coordinate_field.getFieldmodule()
-    field_cache = field_module.createFieldcache()
-    field_cache.setNode(node)
-    values = [-1, -1, -1, 1]
-    result, coordinates = coordinate_field.evaluateReal(field_cache, 3)
-
-    if result == RESULT_OK:
-        radius_field = fields.get("radius")
-        diameter = 1.0
-        if radius_field is not None:
-            result, value = radius_field.evaluateReal(field_cache, 1)
-            if result == RESULT_OK:
-                diameter = 2 * value
+    if eft.getParameterMappingMode() != Elementfieldtemplate.PARAMETER_MAPPING_MODE_NODE:
+        return False
 
-        values = [*coordinates, diameter]
+    if eft.getElementbasis().getFunctionType(-1) != Elementbasis.FUNCTION_TYPE_LINEAR_LAGRANGE:
+        return False
 
-    return values
+    for function_number in range(1, eft.getNumberOfFunctions() + 1):
+        if eft.getFunctionNumberOfTerms(function_number) != 1:
+            return False
+        if eft.getTermLocalNodeIndex(function_number, 1) != function_number:
+            return False
+        if eft.getTermNodeValueLabel(function_number, 1) != Node.VALUE_LABEL_VALUE or eft.getTermNodeVersion(function_number, 1) != 1:
+            return False
+
+    return True
 
 
 def get_string(node, field_name):
@@ -69,13 +75,70 @@ def _evaluate_field(node, field, value_type, default_value=None):
     return value
 
 
-def get_colour(node, fields):
-    result = _evaluate_field(node, fields.get('rgb'), Field.VALUE_TYPE_REAL, default_value=[1, 1, 1])
-    return rgb_to_hex(result)
+def get_node_table(nodes, fields):
+    """
+    Evaluate the point, colour and resolution values for all the given nodes in a single pass.
+    The rows of the returned arrays are in the same order as the given nodes.
+
+    :param nodes: List of Zinc nodes (or datapoints) to evaluate.
+    :param fields: Dictionary of available fields keyed by field name.
+    :return: Dictionary with NumPy arrays for 'points' (x, y, z, diameter), 'colours' and 'resolutions'.
+    """
+    coordinate_field = fields["coordinates"]
+    radius_field = fields.get("radius")
+    rgb_field = fields.get("rgb")
+    rgb_components_count = 3 if rgb_field is None else rgb_field.getNumberOfComponents()
+    resolution_field = fields.get("resolution")
+    node_count = len(nodes)
+    node_table = {
+        'points': np.empty((node_count, 4)),
+        'colours': np.ones((node_count, rgb_components_count)),
+        'resolutions': np.full(node_count, np.nan),
+    }
+    if node_count == 0:
+        return node_table
+
+    field_module = coordinate_field.getFieldmodule()
+    field_cache = field_module.createFieldcache()
+    points = node_table['points']
+    colours = node_table['colours']
+    resolutions = node_table['resolutions']
+    for index, node in enumerate(nodes):
+        field_cache.setNode(node)
+        result, coordinates = coordinate_field.evaluateReal(field_cache, 3)
+        if result == RESULT_OK:
+            diameter = 1.0
+            if radius_field is not None:
+                result, value = radius_field.evaluateReal(field_cache, 1)
+                if result == RESULT_OK:
+                    diameter = 2 * value
+
+            points[index] = [*coordinates, diameter]
+        else:
+            points[index] = [-1, -1, -1, 1]
+
+        if rgb_field is not None:
+            result, rgb = rgb_field.evaluateReal(field_cache, rgb_components_count)
+            if result == RESULT_OK:
+                colours[index] = rgb
+
+        if resolution_field is not None:
+            result, value = resolution_field.evaluateReal(field_cache, 1)
+            if result == RESULT_OK:
+                resolutions[index] = value
+
+    return node_table
 
 
-def get_resolution(node, fields):
-    return _evaluate_field(node, fields.get('resolution'), Field.VALUE_TYPE_REAL)
+def get_node_identifiers(node_set):
+    node_iterator = node_set.createNodeiterator()
+    node_ids = set()
+    node = node_iterator.next()
+    while node.isValid():
+        node_ids.add(node.getIdentifier())
+        node = node_iterator.next()
+
+    return node_ids
 
 
 def get_group_elements_and_nodes(group_fields):
@@ -0,0 +1,53 @@
+import random
+import unittest
+
+from collections import defaultdict
+
+from exf2mbfxml.adjacency import AdjacencyIndex
+
+
+class TestAdjacencyIndex(unittest.TestCase):
+
+    def test_matches_dictionary_maps(self):
+        rng = random.Random(15)
+        for _ in range(100):
+            node_ids = rng.sample(range(1, 1000), rng.randint(1, 20))
+            element_ids = rng.sample(range(1, 1000), rng.randint(0, 30))
+            elements = [{'id': element_id, 'start_node': rng.choice(node_ids), 'end_node': rng.choice(node_ids)} for element_id in element_ids]
+
+            node_map = defaultdict(list)
+            reverse_node_map = defaultdict(list)
+            starting_elements = defaultdict(list)
+            ending_elements = defaultdict(list)
+            for element in elements:
+                node_map[element['start_node']].append(element['end_node'])
+                reverse_node_map[element['end_node']].append(element['start_node'])
+                starting_elements[element['start_node']].append(element['id'])
+                ending_elements[element['end_node']].append(element['id'])
+
+            adjacency = AdjacencyIndex(elements)
+            self.assertEqual(element_ids, list(adjacency.element_ids()))
+            self.assertEqual(set(reverse_node_map.keys()), adjacency.end_nodes())
+            for node_id in node_ids + [0]:
+                self.assertEqual(node_map.get(node_id, []), adjacency.forward_nodes(node_id))
+                self.assertEqual(reverse_node_map.get(node_id, []), adjacency.backward_nodes(node_id))
+                self.assertEqual(len(node_map.get(node_id, [])), adjacency.forward_count(node_id))
+                self.assertEqual(len(reverse_node_map.get(node_id, [])), adjacency.backward_count(node_id))
+                self.assertEqual(set(starting_elements.get(node_id, []) + ending_elements.get(node_id, [])), set(adjacency.node_elements(node_id)))
+
+            for element in elements:
+                self.assertEqual(element['start_node'], adjacency.element_start(element['id']))
+                self.assertEqual(element['end_node'], adjacency.element_end(element['id']))
+                self.assertEqual(starting_elements.get(element['end_node'], []), adjacency.forward_elements(element['id']))
+                self.assertEqual(ending_elements.get(element['start_node'], []), adjacency.backward_elements(element['id']))
+
+    def test_empty(self):
+        adjacency = AdjacencyIndex([])
+        self.assertEqual([], list(adjacency.element_ids()))
+        self.assertEqual([], adjacency.forward_nodes(1))
+        self.assertEqual(0, adjacency.backward_count(1))
+        self.assertEqual(set(), adjacency.end_nodes())
+
+
+if __name__ == "__main__":
+    unittest.main()
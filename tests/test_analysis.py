@@ -1,6 +1,10 @@
+import random
 import unittest
 
-from exf2mbfxml.analysis import determine_forest
+from exf2mbfxml.adjacency import AdjacencyIndex
+from exf2mbfxml.analysis import (
+    _build_group_element_graph, _build_group_index, _discard_group_node, _has_subgroup, _match_group, _match_supergroups,
+    _traverse_forward_path, _update_grouped_nodes, determine_forest)
 
 
 class TestNestingFunctions(unittest.TestCase):
@@ -269,5 +273,113 @@ class TestNestingFunctions(unittest.TestCase):
         self.assertEqual(1, len(forest))
         self.assertEqual(42, len(group_start_nodes))
 
+
+class TestGroupElementGraph(unittest.TestCase):
+
+    def test_group_element_graph(self):
+        adjacency = AdjacencyIndex([{'id': 1, 'start_node': 1, 'end_node': 2}, {'id': 2, 'start_node': 2, 'end_node': 3},
+                                    {'id': 3, 'start_node': 3, 'end_node': 4}, {'id': 4, 'start_node': 3, 'end_node': 5}])
+        self.assertEqual({2: [], 3: [2]}, _build_group_element_graph(adjacency, {2, 3, 7}))
+        self.assertEqual({}, _build_group_element_graph(adjacency, set()))
+
+
+class TestGroupIndex(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        rng = random.Random(12)
+        for _ in range(200):
+            grouped_nodes = {f'group {i}': set(rng.sample(range(12), rng.randint(0, 6))) for i in range(rng.randint(1, 8))}
+            expected_groups = {label: set(node_set) for label, node_set in grouped_nodes.items()}
+            group_index = _build_group_index(grouped_nodes)
+            for _ in range(10):
+                target = set(rng.sample(range(12), rng.randint(0, 5)))
+                if rng.random() < 0.2 and expected_groups:
+                    label = rng.choice(list(expected_groups))
+                    if expected_groups[label]:
+                        node = rng.choice(sorted(expected_groups[label]))
+                        expected_groups[label].discard(node)
+                        _discard_group_node(group_index, label, node)
+
+                expected_subgroup = any(node_set < target for node_set in expected_groups.values() if node_set)
+                self.assertEqual(expected_subgroup, _has_subgroup(group_index, target))
+
+                expected_equal = [label for label, node_set in expected_groups.items() if node_set == target]
+                for label in expected_equal:
+                    expected_groups.pop(label)
+                self.assertEqual(expected_equal, _match_group(target, group_index))
+
+                expected_supergroups = [label for label, node_set in expected_groups.items() if target < node_set]
+                self.assertEqual(expected_supergroups, _match_supergroups(target, group_index))
+                self.assertEqual(expected_groups, grouped_nodes)
+
+    def test_update_grouped_nodes_matches_all_groups_loop(self):
+        def update_all_groups(grouped_nodes, group_start_nodes, plant_set):
+            # The original loop over all the groups for each start node.
+            used_tuples = set()
+            modified = False
+            for start_node in group_start_nodes:
+                first, second = start_node
+                for node_set in grouped_nodes.values():
+                    if first in node_set and second in node_set and node_set < plant_set:
+                        node_set.discard(first)
+                        used_tuples.add(start_node)
+                        modified = True
+
+            group_start_nodes -= used_tuples
+            return modified
+
+        rng = random.Random(16)
+        for _ in range(300):
+            grouped_nodes = {f'group {i}': set(rng.sample(range(10), rng.randint(0, 7))) for i in range(rng.randint(1, 8))}
+            # Both sets are built the same way so that they iterate over the start nodes in the same order.
+            start_nodes = [tuple(rng.sample(range(10), 2)) for _ in range(rng.randint(0, 6))]
+            group_start_nodes = set(start_nodes)
+            expected_start_nodes = set(start_nodes)
+            expected_grouped_nodes = {label: set(node_set) for label, node_set in grouped_nodes.items()}
+            group_index = _build_group_index(grouped_nodes)
+            for _ in range(3):
+                plant_set = set(rng.sample(range(10), rng.randint(2, 10)))
+                expected_modified = update_all_groups(expected_grouped_nodes, expected_start_nodes, plant_set)
+
+                self.assertEqual(expected_modified, _update_grouped_nodes(group_index, group_start_nodes, plant_set))
+                self.assertEqual(expected_grouped_nodes, grouped_nodes)
+                self.assertEqual(expected_start_nodes, group_start_nodes)
+
+            rebuilt_index = _build_group_index({label: set(node_set) for label, node_set in grouped_nodes.items()})
+            self.assertEqual({key: sorted(labels) for key, labels in rebuilt_index['by_nodes'].items()},
+                             {key: sorted(labels) for key, labels in group_index['by_nodes'].items() if labels})
+            self.assertEqual({node: labels for node, labels in rebuilt_index['postings'].items() if labels},
+                             {node: labels for node, labels in group_index['postings'].items() if labels})
+
+
+class TestTraverseForwardPath(unittest.TestCase):
+
+    def test_branches_and_loops(self):
+        edges = [(1, 2), (2, 5), (2, 3), (3, 4), (4, 1), (5, 6)]
+        adjacency = AdjacencyIndex([{'id': 10 + index, 'start_node': start, 'end_node': end} for index, (start, end) in enumerate(edges)])
+        visited = set()
+        path = _traverse_forward_path(adjacency, 1, visited)
+        self.assertEqual([1, 2, [3, 4, 1], [5, 6]], path)
+        self.assertEqual({10, 11, 12, 13, 14, 15}, visited)
+
+    def test_long_chain(self):
+        node_count = 50000
+        adjacency = AdjacencyIndex([{'id': node, 'start_node': node, 'end_node': node + 1} for node in range(1, node_count)])
+        visited = set()
+        path = _traverse_forward_path(adjacency, 1, visited)
+
+        self.assertEqual(list(range(1, node_count + 1)), path)
+        self.assertEqual(set(range(1, node_count)), visited)
+
+    def test_long_loop(self):
+        node_count = 50000
+        adjacency = AdjacencyIndex([{'id': node, 'start_node': node, 'end_node': node % node_count + 1} for node in range(1, node_count + 1)])
+        visited = set()
+        path = _traverse_forward_path(adjacency, 1, visited)
+
+        self.assertEqual(list(range(1, node_count + 1)) + [1], path)
+        self.assertEqual(set(range(1, node_count + 1)), visited)
+
+
 if __name__ == "__main__":
     unittest.main()
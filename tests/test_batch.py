@@ -0,0 +1,114 @@
+import json
+import lzma
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from exf2mbfxml.app import main
+from exf2mbfxml.batch import convert_file, convert_files, find_input_files, output_file_name
+from exf2mbfxml.result_codes import DUPLICATE_OUTPUT_FILE, FAILED_TO_CONVERT, FAILED_TO_READ_EXF, MISSING_INPUT_FILE, SUCCESS
+
+try:
+    from utils import resource_path
+except ImportError:
+    from .utils import resource_path
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._output_dir = tempfile.TemporaryDirectory()
+        self.output_dir = self._output_dir.name
+
+    def tearDown(self):
+        self._output_dir.cleanup()
+
+    def test_find_input_files(self):
+        resources_dir = os.path.dirname(resource_path("basic_tree.exf"))
+        directory_files = find_input_files([resources_dir])
+        self.assertIn(resource_path("basic_tree.exf"), directory_files)
+        self.assertTrue(all(f.endswith('.exf') for f in directory_files))
+
+        glob_files = find_input_files([resource_path("basic_*.exf"), resource_path("basic_tree.exf")])
+        self.assertEqual([resource_path("basic_contour.exf"), resource_path("basic_heart_contours.exf"), resource_path("basic_tree.exf")], glob_files)
+
+        self.assertEqual([resource_path("missing.exf")], find_input_files([resource_path("missing.exf")]))
+
+    def test_convert_files(self):
+        input_files = [resource_path("basic_tree.exf"), resource_path("xml_file.exf"), resource_path("missing.exf"), resource_path("basic_contour.exf")]
+        for workers in [1, 2]:
+            with self.subTest(workers=workers):
+                results = convert_files(input_files, self.output_dir, workers)
+
+                self.assertEqual(input_files, list(results.keys()))
+                self.assertEqual([SUCCESS, FAILED_TO_READ_EXF, MISSING_INPUT_FILE, SUCCESS], list(results.values()))
+                self.assertTrue(os.path.isfile(output_file_name(input_files[0], self.output_dir)))
+                self.assertTrue(os.path.isfile(output_file_name(input_files[3], self.output_dir)))
+
+    def test_failed_conversion_logged(self):
+        input_files = [resource_path("basic_tree.exf")]
+        with patch('exf2mbfxml.batch.convert_file', side_effect=RuntimeError('conversion failure')):
+            with self.assertLogs('exf2mbfxml.batch', 'ERROR') as logs:
+                results = convert_files(input_files, self.output_dir, 1)
+
+        self.assertEqual([FAILED_TO_CONVERT], list(results.values()))
+        self.assertIn(input_files[0], logs.output[0])
+        self.assertIn('conversion failure', logs.output[0])
+
+    def test_duplicate_output_files(self):
+        input_dir = os.path.join(self.output_dir, 'inputs')
+        os.makedirs(input_dir)
+        copied_exf = os.path.join(input_dir, 'basic_tree.exf')
+        with open(resource_path("tree_with_branches.exf"), 'rb') as f, open(copied_exf, 'wb') as g:
+            g.write(f.read())
+
+        output_dir = os.path.join(self.output_dir, 'outputs')
+        input_files = [resource_path("basic_tree.exf"), copied_exf]
+        results = convert_files(input_files, output_dir, 1)
+        self.assertEqual([SUCCESS, DUPLICATE_OUTPUT_FILE], list(results.values()))
+        expected_mbf = os.path.join(self.output_dir, 'expected.xml')
+        self.assertEqual(SUCCESS, convert_file(input_files[0], expected_mbf))
+        with open(output_file_name(input_files[0], output_dir), 'rb') as f, open(expected_mbf, 'rb') as g:
+            self.assertEqual(g.read(), f.read())
+
+    def test_convert_file_stream(self):
+        input_exf = resource_path("basic_contour.exf")
+        output_mbf = output_file_name(input_exf, self.output_dir)
+        streamed_mbf = os.path.join(self.output_dir, 'streamed.xml')
+        self.assertEqual(SUCCESS, convert_file(input_exf, output_mbf))
+        self.assertEqual(SUCCESS, convert_file(input_exf, streamed_mbf, stream=True))
+        with open(output_mbf, 'rb') as f, open(streamed_mbf, 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+
+        self.assertEqual(FAILED_TO_READ_EXF, convert_file(resource_path("xml_file.exf"), streamed_mbf, stream=True))
+
+    def test_main_compress(self):
+        input_exf = resource_path("basic_tree.exf")
+        output_mbf = os.path.join(self.output_dir, 'basic_tree.exf.xml.xz')
+        with patch('sys.argv', ['app.py', input_exf, '--output-mbf', output_mbf, '--compress', 'xz']):
+            self.assertEqual(SUCCESS, main())
+
+        with lzma.open(output_mbf) as f:
+            self.assertTrue(f.read().startswith(b"<?xml version='1.0' encoding='ISO-8859-1'?>"))
+
+        self.assertEqual(os.path.join(self.output_dir, 'basic_tree.exf.xml.gz'), output_file_name(input_exf, self.output_dir, 'gzip'))
+
+    def test_batch_main(self):
+        summary_file = os.path.join(self.output_dir, 'summary.json')
+        argv = ['app.py', '--batch', resource_path("tree_*.exf"), resource_path("xml_file.exf"),
+                '--output-dir', self.output_dir, '--workers', '2', '--summary', summary_file]
+        with patch('sys.argv', argv):
+            self.assertEqual(FAILED_TO_READ_EXF, main())
+
+        with open(summary_file) as f:
+            summary = json.load(f)
+
+        self.assertEqual(2, summary['counts']['SUCCESS'])
+        self.assertEqual(1, summary['counts']['FAILED_TO_READ_EXF'])
+        self.assertEqual('FAILED_TO_READ_EXF', summary['files'][-1]['result'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from exf2mbfxml.cache import cache_key, clear, read_exf_cached
+from exf2mbfxml.reader import read_exf
+
+try:
+    from utils import resource_path
+except ImportError:
+    from .utils import resource_path
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._cache_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self._cache_dir.name
+
+    def tearDown(self):
+        self._cache_dir.cleanup()
+
+    def _cache_files(self):
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_cache_hit(self):
+        exf_file = resource_path("multi_tree_with_annotations.exf")
+        expected_mesh_info = read_exf(exf_file)
+
+        self.assertEqual(expected_mesh_info, read_exf_cached(exf_file, self.cache_dir))
+        self.assertEqual([cache_key(exf_file) + '.mbfcache'], self._cache_files())
+
+        with patch('exf2mbfxml.cache.read_exf') as mock_read_exf:
+            self.assertEqual(expected_mesh_info, read_exf_cached(exf_file, self.cache_dir))
+            mock_read_exf.assert_not_called()
+
+    def test_cache_key(self):
+        exf_file = resource_path("basic_tree.exf")
+        with open(exf_file, 'rb') as fh:
+            data = fh.read()
+        copied_exf_file = os.path.join(self.cache_dir, 'copy.exf')
+        with open(copied_exf_file, 'wb') as fh:
+            fh.write(data)
+
+        self.assertEqual(cache_key(exf_file), cache_key(copied_exf_file))
+        self.assertNotEqual(cache_key(exf_file), cache_key(resource_path("basic_contour.exf")))
+        original_key = cache_key(exf_file)
+        with patch('exf2mbfxml.cache.package_version', '0.0.0.test'):
+            self.assertNotEqual(original_key, cache_key(copied_exf_file))
+        with patch('exf2mbfxml.cache._INTERPRETER', 'cpython 2.7'):
+            self.assertNotEqual(original_key, cache_key(copied_exf_file))
+        self.assertEqual(original_key, cache_key(exf_file, native_parser=False, context=None))
+        self.assertNotEqual(original_key, cache_key(exf_file, native_parser=True))
+        self.assertNotEqual(original_key, cache_key(exf_file, virtual_branches=True))
+
+    def test_read_options(self):
+        exf_file = resource_path("tree_with_linear_branch_elements.exf")
+        read_exf_cached(exf_file, self.cache_dir)
+        with patch('exf2mbfxml.cache.read_exf', return_value={'trees': []}) as mock_read_exf:
+            self.assertEqual({'trees': []}, read_exf_cached(exf_file, self.cache_dir, virtual_branches=True))
+            mock_read_exf.assert_called_once_with(exf_file, virtual_branches=True)
+        self.assertEqual(2, len(self._cache_files()))
+
+    def test_eviction(self):
+        resource_names = ["basic_tree.exf", "basic_contour.exf", "tree_with_branches.exf"]
+        for resource_name in resource_names:
+            read_exf_cached(resource_path(resource_name), self.cache_dir)
+        self.assertEqual(3, len(self._cache_files()))
+
+        clear(self.cache_dir)
+        self.assertEqual([], self._cache_files())
+
+        read_exf_cached(resource_path(resource_names[0]), self.cache_dir)
+        read_exf_cached(resource_path(resource_names[1]), self.cache_dir, max_cache_size=1)
+        self.assertEqual([], self._cache_files())
+
+    def test_failed_read_not_cached(self):
+        self.assertIsNone(read_exf_cached(resource_path("xml_file.exf"), self.cache_dir))
+        self.assertFalse(os.path.exists(self.cache_dir) and self._cache_files())
+
+    def test_corrupt_entry(self):
+        exf_file = resource_path("basic_tree.exf")
+        expected_mesh_info = read_exf(exf_file)
+        read_exf_cached(exf_file, self.cache_dir)
+        with open(os.path.join(self.cache_dir, self._cache_files()[0]), 'wb') as fh:
+            fh.write(b'corrupt')
+
+        self.assertEqual(expected_mesh_info, read_exf_cached(exf_file, self.cache_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -94,7 +94,7 @@ class EXFTreeTestCase(unittest.TestCase):
             {'tag': 'contour', 'points': {'x': '668.78', 'y': '-415.46', 'z': '-75.50', 'd': '4.09'}},
             {'tag': 'contour', 'points': {'x': '645.60', 'y': '-1056.82', 'z': '-88.50', 'd': '4.09'}},
             {'tag': 'contour', 'points': {'x': '1200.86', 'y': '-972.36', 'z': '-153.50', 'd': '4.09'}},
-            {'tag': 'contour', 'points': {'x': '-7.27', 'y': '-1288.34', 'z': '0.00', 'd': '17.44'}},
+            {'tag': 'contour', 'points': {'x': '1299.23', 'y': '-6.54', 'z': '0.00', 'd': '17.44'}},
             {'tag': 'contour', 'points': {'x': '1299.23', 'y': '-1287.61', 'z': '-294.00', 'd': '15.99'}},
             {'tag': 'tree', 'points': {'x': '1101.16', 'y': '-973.74', 'z': '-80.50', 'd': '4.09'},
              'children':
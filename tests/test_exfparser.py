@@ -0,0 +1,92 @@
+import io
+import unittest
+
+from unittest.mock import patch
+
+from exf2mbfxml.exceptions import EXFUnsupported
+from exf2mbfxml.exfparser import parse_exf, parse_exf_buffer, parse_exf_lines
+from exf2mbfxml.reader import extract_parsed_mesh_info, read_exf, read_exf_buffer
+
+try:
+    from utils import resource_path
+except ImportError:
+    from .utils import resource_path
+
+
+NATIVE_RESOURCES = [
+    "basic_contour.exf",
+    "basic_heart_contours.exf",
+    "basic_tree.exf",
+    "contour_with_marker_names.exf",
+    "multi_tree_with_annotations.exf",
+    "simple_vessel_structure.exf",
+    "tree_with_branches.exf",
+    "tree_with_linear_branch_elements.exf",
+]
+
+
+class TestEXFParser(unittest.TestCase):
+
+    def test_native_matches_zinc(self):
+        for resource_name in NATIVE_RESOURCES:
+            with self.subTest(resource_name=resource_name):
+                exf_file = resource_path(resource_name)
+                self.assertEqual(read_exf(exf_file), read_exf(exf_file, native_parser=True))
+
+    def test_parse_groups_and_markers(self):
+        mesh_data = parse_exf(resource_path("contour_with_marker_names.exf"))
+
+        self.assertIn('marker', mesh_data['grouped_identifiers'])
+        self.assertTrue(len(mesh_data['markers']) > 0)
+        self.assertTrue(all(marker['metadata']['name'] is not None for marker in mesh_data['markers']))
+        self.assertEqual(len(mesh_data['node_identifier_to_index_map']), mesh_data['node_table']['points'].shape[0])
+
+    def test_unsupported_falls_back(self):
+        for resource_name in ["vagus_scaffold.exf", "japanese_vagus.exf"]:
+            with self.subTest(resource_name=resource_name):
+                exf_file = resource_path(resource_name)
+                self.assertRaises(EXFUnsupported, parse_exf, exf_file)
+                self.assertEqual(read_exf(exf_file), read_exf(exf_file, native_parser=True))
+
+    def test_unsupported_lines(self):
+        self.assertRaises(EXFUnsupported, parse_exf, resource_path("xml_file.exf"))
+        self.assertRaises(EXFUnsupported, parse_exf_lines, ["EX Version: 3", "Region: /child"])
+        self.assertRaises(EXFUnsupported, parse_exf_lines, ["EX Version: 3", "Region: /", "!#mesh mesh2d, dimension=2, nodeset=nodes"])
+
+    def test_malformed_text(self):
+        with open(resource_path("tree_with_branches.exf"), 'rb') as f:
+            data = f.read()
+
+        sources = [data[:end] for end in range(0, len(data), 5)]
+        sources += [data[:index] + b'x' + data[index + 1:] for index in range(0, len(data), 11)]
+        sources.append(data.replace(b'Node: 3', b'Node: 3 4'))
+        for source in sources:
+            try:
+                mesh_data = parse_exf_buffer(source)
+            except EXFUnsupported:
+                continue
+            extract_parsed_mesh_info(mesh_data)
+
+        self.assertRaises(EXFUnsupported, parse_exf_buffer, b'\xff\xfe')
+        truncated = data[:len(data) // 2]
+        self.assertEqual(read_exf_buffer(truncated), read_exf_buffer(truncated, native_parser=True))
+
+    def test_chunk_boundaries(self):
+        exf_file = resource_path("tree_with_branches.exf")
+        expected = read_exf(exf_file, native_parser=True)
+        with open(exf_file, 'rb') as f:
+            data = f.read()
+
+        for chunk_size in [1, 7, 64]:
+            with self.subTest(chunk_size=chunk_size), patch('exf2mbfxml.exfparser._CHUNK_SIZE', chunk_size):
+                self.assertEqual(expected, read_exf(exf_file, native_parser=True))
+                self.assertEqual(expected, extract_parsed_mesh_info(parse_exf_buffer(data.replace(b'\n', b'\r\n'))))
+                self.assertEqual(expected, extract_parsed_mesh_info(parse_exf_lines(io.BytesIO(data))))
+
+    def test_errors_propagate(self):
+        with patch('exf2mbfxml.exfparser._NodeValues.rows', side_effect=KeyError('internal')):
+            self.assertRaises(KeyError, parse_exf, resource_path("basic_tree.exf"))
+
+
+if __name__ == "__main__":
+    unittest.main()
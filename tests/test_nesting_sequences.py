@@ -1,7 +1,8 @@
 
+import random
 import unittest
 
-from exf2mbfxml.utilities import nest_multiple_sequences, find_matching_subsequence, get_unique_list_paths, get_identifiers_from_path
+from exf2mbfxml.utilities import nest_multiple_sequences, nest_sequence, nest_sequences, find_matching_subsequence, get_unique_list_paths, get_identifiers_from_path, project_points_onto_segments
 
 
 class TestNestingFunctions(unittest.TestCase):
@@ -160,5 +161,44 @@ class TestGetIdentifiersFunctions(unittest.TestCase):
         self.assertIsNone(get_identifiers_from_path(path, data))
 
 
+class TestNestSequencesFunctions(unittest.TestCase):
+    def test_multiple_levels(self):
+        data = [1, 2, 3, 4, 5, 6, 7, 8, [9, 10, 11, 12], [13, 14, 15, 16, 17, 18]]
+        sequences = [{15, 16}, {10, 11}, {3, 4}, {13, 14}]
+        expected = [1, 2, [3, 4, [5, 6, 7, 8, [9, [10, 11, [12]]], [13, 14, [15, 16, [17, 18]]]]]]
+        self.assertEqual(expected, nest_sequences(data, sequences))
+
+    def test_invalid_input(self):
+        self.assertEqual([], nest_sequences(None, [{1}]))
+        self.assertEqual([1, [2, 3]], nest_sequences([1, [2, 3]], []))
+
+    def test_matches_nest_sequence(self):
+        def random_tree(rng, depth):
+            tree = []
+            for _ in range(rng.randint(0, 8)):
+                tree.append(random_tree(rng, depth + 1) if depth < 4 and rng.random() < 0.3 else rng.randint(1, 12))
+            return tree
+
+        rng = random.Random(5)
+        for _ in range(2000):
+            data = random_tree(rng, 0)
+            sequences = [set(rng.sample(range(1, 13), rng.randint(1, 3))) for _ in range(rng.randint(1, 6))]
+            expected = data
+            for sequence in sequences:
+                expected = nest_sequence(expected, sequence)
+
+            self.assertEqual(expected, nest_sequences(data, sequences))
+
+
+class TestProjectPointsFunctions(unittest.TestCase):
+    def test_interior_and_clamped(self):
+        points = [[4, 6, 0], [-3, 1, 0], [14, -2, 0]]
+        starts = [[0, 0, 0], [0, 0, 0], [10, 0, 0]]
+        ends = [[10, 0, 0], [10, 0, 0], [10, 0, 0]]
+        xi, projected = project_points_onto_segments(points, starts, ends)
+        self.assertEqual([0.4, 0.0, 0.0], xi.tolist())
+        self.assertEqual([[4.0, 0.0, 0.0], [0.0, 0.0, 0.0], [10.0, 0.0, 0.0]], projected.tolist())
+
+
 if __name__ == '__main__':
     unittest.main()
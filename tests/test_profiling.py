@@ -0,0 +1,106 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from cmlibs.zinc.field import Field
+
+from exf2mbfxml.app import main
+from exf2mbfxml.profiling import profile, stage, stage_iterator
+from exf2mbfxml.reader import read_exf, read_exf_buffer
+
+try:
+    from utils import resource_path
+except ImportError:
+    from .utils import resource_path
+
+
+class ProfileTestCase(unittest.TestCase):
+
+    def test_nested_stages(self):
+        ended = []
+        with profile(callback=lambda name, record: ended.append(name)) as report:
+            with stage('outer'):
+                with stage('inner'):
+                    values = list(range(100000))
+                with stage('inner'):
+                    pass
+            del values
+
+        stages = report.stages()
+        self.assertEqual(['inner', 'inner', 'outer'], ended)
+        self.assertEqual(['inner', 'outer'], list(stages))
+        self.assertEqual(2, stages['inner']['calls'])
+        self.assertGreater(stages['inner']['peak_memory'], 800000)
+        self.assertGreaterEqual(stages['outer']['peak_memory'], stages['inner']['peak_memory'])
+        self.assertGreaterEqual(stages['outer']['wall_time'], stages['inner']['wall_time'])
+        self.assertGreaterEqual(report.wall_time, stages['outer']['wall_time'])
+
+    def test_stage_iterator(self):
+        with profile(trace_memory=False) as report:
+            self.assertEqual([1, 2, 3], list(stage_iterator('items', [1, 2, 3])))
+
+        self.assertEqual(4, report.stages()['items']['calls'])
+        self.assertEqual(0, report.stages()['items']['peak_memory'])
+
+    def test_inactive(self):
+        with stage('unmeasured'):
+            pass
+        self.assertEqual([1], list(stage_iterator('unmeasured', [1])))
+
+    def test_read_exf(self):
+        evaluate_real = Field.evaluateReal
+        with profile() as report:
+            contents = read_exf(resource_path("tree_with_linear_branch_elements.exf"))
+
+        self.assertIs(evaluate_real, Field.evaluateReal)
+        self.assertEqual(1, len(contents['trees']))
+        result = report.to_dict()
+        for name in ['read_exf', 'readFile', 'extract_mesh_info', 'determine_forest', 'classify_forest', 'read_markers']:
+            self.assertIn(name, result['stages'])
+        self.assertGreater(result['counters']['fieldcache_creations'], 0)
+        self.assertGreater(result['counters']['field_evaluations'], 0)
+        self.assertGreater(result['counters']['elements_created'], 0)
+
+        output = io.StringIO()
+        report.write(output)
+        self.assertEqual(result['counters'], json.loads(output.getvalue())['counters'])
+
+    def test_native_parser(self):
+        with profile(trace_memory=False) as report:
+            read_exf(resource_path("tree_with_linear_branch_elements.exf"), native_parser=True)
+
+        self.assertIn('parse_exf', report.stages())
+        self.assertEqual({'fieldcache_creations': 0, 'field_evaluations': 0, 'elements_created': 0}, report.counters)
+
+    def test_read_exf_buffer(self):
+        with open(resource_path("tree_with_linear_branch_elements.exf"), 'rb') as f:
+            data = f.read()
+
+        for native_parser, read_stage in [(False, 'readFile'), (True, 'parse_exf')]:
+            with self.subTest(native_parser=native_parser):
+                with profile(trace_memory=False) as report:
+                    read_exf_buffer(data, native_parser=native_parser)
+
+                self.assertIn('read_exf', report.stages())
+                self.assertIn(read_stage, report.stages())
+
+    def test_command_line(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output_mbf = os.path.join(directory, 'output.xml')
+            profile_file = os.path.join(directory, 'profile.json')
+            with patch('sys.argv', ['app.py', resource_path("basic_tree.exf"), '--output-mbf', output_mbf, '--profile', profile_file]):
+                self.assertEqual(0, main())
+
+            with open(profile_file) as f:
+                result = json.load(f)
+
+        self.assertIn('write_mbfxml', result['stages'])
+        self.assertIn('read_exf', result['stages'])
+
+
+if __name__ == "__main__":
+    unittest.main()
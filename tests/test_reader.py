@@ -1,9 +1,16 @@
+import io
+import mmap
 import unittest
 
+from unittest.mock import patch
+
 from cmlibs.zinc.context import Context
+from cmlibs.zinc.field import Field
 from cmlibs.zinc.result import RESULT_OK
 
-from exf2mbfxml.reader import extract_mesh_info
+from exf2mbfxml.reader import extract_mesh_info, iterate_exf, read_exf, read_exf_buffer
+from exf2mbfxml.utilities import determine_fields, rgb_to_hex
+from exf2mbfxml.zinc import get_node_table
 
 try:
     from utils import resource_path
@@ -28,5 +35,109 @@ class TestMeshInfo(unittest.TestCase):
         self.assertEqual(0, len(mesh_info['vessels']))
         self.assertEqual(0, len(mesh_info['contours']))
 
+    def test_linear_branch_projection_matches_zinc(self):
+        exf_file = resource_path("tree_with_linear_branch_elements.exf")
+        mesh_info = read_exf(exf_file)
+        with patch('exf2mbfxml.reader.is_linear_lagrange_template', return_value=False):
+            zinc_mesh_info = read_exf(exf_file)
+
+        self.assertEqual(zinc_mesh_info, mesh_info)
+        self.assertEqual(1, len(mesh_info['trees']))
+        self.assertEqual([2.0, 0.0, 0.0, 1.0], mesh_info['trees'][0]['points'][1])
+
+    def test_virtual_branches(self):
+        for resource_name in ["vagus_scaffold.exf", "tree_with_linear_branch_elements.exf"]:
+            exf_file = resource_path(resource_name)
+            context = Context("read")
+            region = context.createRegion()
+            self.assertEqual(RESULT_OK, region.readFile(exf_file))
+            field_module = region.getFieldmodule()
+            node_count = field_module.findNodesetByFieldDomainType(Field.DOMAIN_TYPE_NODES).getSize()
+            element_count = field_module.findMeshByDimension(1).getSize()
+
+            mesh_info = extract_mesh_info(region, virtual_branches=True)
+
+            self.assertEqual(node_count, field_module.findNodesetByFieldDomainType(Field.DOMAIN_TYPE_NODES).getSize())
+            self.assertEqual(element_count, field_module.findMeshByDimension(1).getSize())
+            self.assertEqual(read_exf(exf_file), mesh_info)
+
+
+class TestIterateEXF(unittest.TestCase):
+    def test_iterate_exf(self):
+        for resource_name in ["contour_with_marker_names.exf", "multi_tree_with_annotations.exf", "simple_vessel_structure.exf"]:
+            exf_file = resource_path(resource_name)
+            expected_mesh_info = read_exf(exf_file)
+            for native_parser in [False, True]:
+                with self.subTest(resource_name=resource_name, native_parser=native_parser):
+                    items = list(iterate_exf(exf_file, native_parser=native_parser))
+                    categories = [category for category, _ in items]
+                    marker_count = len(expected_mesh_info['markers'])
+                    self.assertEqual(['markers'] * marker_count, categories[:marker_count])
+                    for category in ['contours', 'trees', 'vessels', 'markers']:
+                        self.assertEqual(expected_mesh_info[category], [item for item_category, item in items if item_category == category])
+
+    def test_iterate_exf_invalid(self):
+        self.assertIsNone(iterate_exf(resource_path("xml_file.exf")))
+        self.assertIsNone(iterate_exf(resource_path("xml_file.exf"), native_parser=True))
+
+
+class TestReadBuffer(unittest.TestCase):
+    def test_read_exf_buffer(self):
+        for resource_name in ["tree_with_branches.exf", "vagus_scaffold.exf"]:
+            exf_file = resource_path(resource_name)
+            expected_mesh_info = read_exf(exf_file)
+            with open(exf_file, "rb") as fh:
+                data = fh.read()
+
+            for native_parser in [False, True]:
+                with self.subTest(resource_name=resource_name, native_parser=native_parser):
+                    self.assertEqual(expected_mesh_info, read_exf_buffer(data, native_parser=native_parser))
+                    self.assertEqual(expected_mesh_info, read_exf_buffer(bytearray(data), native_parser=native_parser))
+                    self.assertEqual(expected_mesh_info, read_exf_buffer(memoryview(data), native_parser=native_parser))
+                    self.assertEqual(expected_mesh_info, read_exf_buffer(io.BytesIO(data), native_parser=native_parser))
+                    self.assertEqual(expected_mesh_info, read_exf_buffer(io.StringIO(data.decode("utf-8")), native_parser=native_parser))
+                    with open(exf_file, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        self.assertEqual(expected_mesh_info, read_exf_buffer(mapped, native_parser=native_parser))
+
+    def test_read_exf_buffer_invalid(self):
+        with open(resource_path("xml_file.exf"), "rb") as fh:
+            data = fh.read()
+
+        self.assertIsNone(read_exf_buffer(data))
+        self.assertIsNone(read_exf_buffer(data, native_parser=True))
+
+
+class TestNodeTable(unittest.TestCase):
+    def test_node_table_matches_node_evaluation(self):
+        exf_file = resource_path("tree_with_branches.exf")
+        context = Context("read")
+        region = context.createRegion()
+        self.assertEqual(RESULT_OK, region.readFile(exf_file))
+
+        field_module = region.getFieldmodule()
+        _, available_fields, _ = determine_fields(field_module)
+        fields = {available_field.getName(): available_field for available_field in available_fields}
+        nodes = []
+        node_iterator = field_module.findNodesetByFieldDomainType(Field.DOMAIN_TYPE_NODES).createNodeiterator()
+        node = node_iterator.next()
+        while node.isValid():
+            nodes.append(node)
+            node = node_iterator.next()
+
+        node_table = get_node_table(nodes, fields)
+
+        self.assertEqual((18, 4), node_table['points'].shape)
+        self.assertEqual((18, 3), node_table['colours'].shape)
+        field_cache = field_module.createFieldcache()
+        for index, node in enumerate(nodes):
+            field_cache.setNode(node)
+            _, coordinates = fields['coordinates'].evaluateReal(field_cache, 3)
+            _, radius = fields['radius'].evaluateReal(field_cache, 1)
+            _, rgb = fields['rgb'].evaluateReal(field_cache, 3)
+            self.assertEqual([*coordinates, 2 * radius], node_table['points'][index].tolist())
+            self.assertEqual(rgb_to_hex(rgb), rgb_to_hex(node_table['colours'][index]))
+        self.assertTrue(all(value != value for value in node_table['resolutions']))
+
+
 if __name__ == "__main__":
     unittest.main()
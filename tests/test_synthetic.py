@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from exf2mbfxml.reader import read_exf
+from exf2mbfxml.synthetic import _ranges, write_synthetic_exf
+
+
+class SyntheticExfTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._exf_file = os.path.join(self._directory.name, 'synthetic.exf')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_structures(self):
+        counts = write_synthetic_exf(self._exf_file, node_count=400, tree_count=2, branching_factor=3, tree_depth=2,
+                                     contour_count=3, vessel_count=2, group_count=5, marker_count=7)
+        # Only the root branch of each tree has one fewer element than nodes.
+        self.assertEqual(counts['nodes'] - 2, counts['elements'])
+        result = read_exf(self._exf_file)
+        self.assertEqual(2, len(result['trees']))
+        self.assertEqual(3, len(result['contours']))
+        self.assertEqual(2, len(result['vessels']))
+        self.assertEqual(7, len(result['markers']))
+        self.assertEqual('Marker 1', result['markers'][3]['metadata']['name'])
+        self.assertEqual(result, read_exf(self._exf_file, native_parser=True))
+
+    def test_three_node_branches(self):
+        counts = write_synthetic_exf(self._exf_file, node_count=200, branching_factor=2, tree_depth=3, three_node_branches=True, group_count=2)
+        self.assertEqual(14, counts['branch_elements'])
+        result = read_exf(self._exf_file)
+        self.assertEqual(1, len(result['trees']))
+        self.assertEqual(result, read_exf(self._exf_file, native_parser=True))
+
+    def test_deterministic(self):
+        write_synthetic_exf(self._exf_file, node_count=100, seed=3)
+        with open(self._exf_file) as f:
+            first = f.read()
+        write_synthetic_exf(self._exf_file, node_count=100, seed=3)
+        with open(self._exf_file) as f:
+            self.assertEqual(first, f.read())
+
+    def test_ranges(self):
+        self.assertEqual('1..4,6', _ranges([1, 2, 3, 4, 6]))
+        self.assertEqual('3', _ranges([3]))
+        self.assertEqual('1,3..4', _ranges([1, 3, 4]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import copy
+import gzip
+import io
+import lzma
+import math
+import os
+import tempfile
+import unittest
+
+import xml.etree.ElementTree as ET
+
+from unittest.mock import patch
+
+from exf2mbfxml.reader import read_exf
+from exf2mbfxml.writer import _LabelKinds, _format_points, _write_mbfxml_tree, _write_point, write_mbfxml, write_mbfxml_items
+
+try:
+    from utils import resource_path
+except ImportError:
+    from .utils import resource_path
+
+
+def _tree_output(data, precision=2):
+    output = io.BytesIO()
+    _write_mbfxml_tree(output, copy.deepcopy(data), precision)
+    return output.getvalue()
+
+
+def _streamed_output(data, options=None):
+    output = io.BytesIO()
+    write_mbfxml(output, copy.deepcopy(data), options)
+    return output.getvalue()
+
+
+class TestStreamingWriter(unittest.TestCase):
+
+    def test_matches_element_tree_output(self):
+        for resource_name in ["basic_heart_contours.exf", "contour_with_marker_names.exf", "japanese_vagus.exf",
+                              "multi_tree_with_annotations.exf", "simple_vessel_structure.exf", "tree_with_branches.exf"]:
+            with self.subTest(resource_name=resource_name):
+                data = read_exf(resource_path(resource_name))
+                self.assertEqual(_tree_output(data), _streamed_output(data))
+
+    def test_precision(self):
+        data = read_exf(resource_path("multi_tree_with_annotations.exf"))
+        for precision in [0, 2, 5]:
+            with self.subTest(precision=precision):
+                self.assertEqual(_tree_output(data, precision), _streamed_output(data, {'precision': precision}))
+
+    def test_format_points(self):
+        points = [[1.005, -0.0, 2, 1e10], [math.nan, math.inf, -math.inf, 0.125], [-2.5, 3.14159, 7, 0]]
+        for precision in [0, 2, 3]:
+            with self.subTest(precision=precision):
+                parent_element = ET.Element("tree")
+                for point in points:
+                    _write_point(parent_element, point, precision)
+                expected = "\n".join(ET.tostring(point_element, encoding="unicode") for point_element in parent_element)
+                self.assertEqual(expected, _format_points(points, precision, "\n"))
+
+    def test_workers(self):
+        for resource_name in ["japanese_vagus.exf", "multi_tree_with_annotations.exf", "simple_vessel_structure.exf"]:
+            with self.subTest(resource_name=resource_name):
+                data = read_exf(resource_path(resource_name))
+                self.assertEqual(_tree_output(data, 3), _streamed_output(data, {'workers': 2, 'precision': 3}))
+
+        self.assertEqual(_tree_output({}), _streamed_output({}, {'workers': 2}))
+
+    def test_unencodable_characters(self):
+        data = read_exf(resource_path("contour_with_marker_names.exf"))
+        data['markers'][0]['metadata']['name'] = 'ChAT \u795e\u7d4c'
+        expected = _tree_output(data)
+        self.assertIn(b'ChAT &#31070;&#32076;', expected)
+        self.assertEqual(expected, _streamed_output(data))
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_mbf = os.path.join(output_dir, "unencodable.xml")
+            with open(output_mbf, "wb", buffering=0) as fh:
+                write_mbfxml(fh, copy.deepcopy(data))
+                self.assertFalse(fh.closed)
+            with open(output_mbf, "rb") as fh:
+                self.assertEqual(expected, fh.read())
+
+    def test_empty(self):
+        self.assertEqual(_tree_output({}), _streamed_output({}))
+        self.assertTrue(_streamed_output({}).endswith(b'/>'))
+
+    def test_file_name(self):
+        data = read_exf(resource_path("basic_tree.exf"))
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_mbf = os.path.join(output_dir, "basic_tree_streamed.exf.xml")
+            write_mbfxml(output_mbf, copy.deepcopy(data))
+            with open(output_mbf, "rb") as fh:
+                self.assertEqual(_tree_output(data), fh.read())
+
+    def test_write_items(self):
+        data = read_exf(resource_path("multi_tree_with_annotations.exf"))
+        items = [(category, item) for category in ['markers', 'contours', 'trees', 'vessels'] for item in copy.deepcopy(data).get(category, [])]
+        output = io.BytesIO()
+        write_mbfxml_items(output, iter(items))
+        self.assertEqual(_tree_output(data), output.getvalue())
+
+    def test_compression(self):
+        data = read_exf(resource_path("multi_tree_with_annotations.exf"))
+        expected = _tree_output(data)
+        with tempfile.TemporaryDirectory() as output_dir:
+            for compression, decompress in [('gzip', gzip.decompress), ('xz', lzma.decompress)]:
+                with self.subTest(compression=compression):
+                    output = io.BytesIO()
+                    write_mbfxml(output, copy.deepcopy(data), {'compression': compression})
+                    self.assertFalse(output.closed)
+                    self.assertEqual(expected, decompress(output.getvalue()))
+
+                    output_mbf = os.path.join(output_dir, f"multi_tree_with_annotations_compressed.exf.xml.{compression}")
+                    write_mbfxml(output_mbf, copy.deepcopy(data), {'compression': compression})
+                    with open(output_mbf, "rb") as fh:
+                        self.assertEqual(expected, decompress(fh.read()))
+
+        self.assertRaises(ValueError, write_mbfxml, io.BytesIO(), copy.deepcopy(data), {'compression': 'zip'})
+
+    def test_write_only_target(self):
+        class WriteOnly(object):
+            def __init__(self):
+                self.chunks = []
+
+            def write(self, chunk):
+                self.chunks.append(bytes(chunk))
+                return len(chunk)
+
+        data = read_exf(resource_path("tree_with_branches.exf"))
+        for compression, decompress in [(None, bytes), ('gzip', gzip.decompress)]:
+            with self.subTest(compression=compression):
+                output = WriteOnly()
+                write_mbfxml(output, copy.deepcopy(data), {'compression': compression})
+                self.assertEqual(_tree_output(data), decompress(b''.join(output.chunks)))
+
+    def test_namespaced_label(self):
+        data = {'contours': [{'points': [[1.0, 2.0, 3.0, 1.0], [2.0, 2.0, 3.0, 1.0]],
+                              'metadata': {'global': {'labels': ['heart', '<property xmlns="http://example.com/ns" name="x"/>']}}}]}
+        self.assertEqual(_tree_output(data), _streamed_output(data))
+
+
+class TestLabelKinds(unittest.TestCase):
+
+    def test_classify(self):
+        label_kinds = _LabelKinds()
+        self.assertEqual(('TraceAssociation', True, None), label_kinds.classify('http://uri.interlex.org/base/ilx_0738426'))
+        self.assertEqual(('Set', True, None), label_kinds.classify('FIL:Fibre'))
+        self.assertEqual(('Set', False, None), label_kinds.classify('left vagus nerve'))
+        tag_name, is_type_of_property, fragment = label_kinds.classify('<property name="x"><s>y</s></property>')
+        self.assertIsNone(tag_name)
+        self.assertTrue(is_type_of_property)
+        self.assertEqual('property', fragment.tag)
+
+    def test_parse_once(self):
+        label = '<property name="x"><s>y</s></property>'
+        label_kinds = _LabelKinds()
+        with patch('exf2mbfxml.writer.ET.fromstring', wraps=ET.fromstring) as fromstring:
+            first = label_kinds.copy_fragment(label)
+            second = label_kinds.copy_fragment(label)
+            self.assertTrue(label_kinds.is_type_of_property(label))
+
+        self.assertEqual(1, fromstring.call_count)
+        self.assertIsNot(first, second)
+        self.assertEqual(ET.tostring(first), ET.tostring(second))
+
+    def test_repeated_xml_label(self):
+        label = '<property name="x"><s>y</s></property>'
+        contour = {'points': [[1.0, 2.0, 3.0, 1.0]], 'metadata': {'global': {'labels': ['heart', label]}}}
+        output = _streamed_output({'contours': [contour, copy.deepcopy(contour)]}).decode('ISO-8859-1')
+        self.assertEqual(2, output.count('<property name="x">\n      <s>y</s>\n    </property>'))
+
+
+if __name__ == "__main__":
+    unittest.main()